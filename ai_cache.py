@@ -0,0 +1,156 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+import pandas as pd
+from config import AI_CACHE_PATH, AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS
+from database import ConnectionManager
+
+
+def content_hash(sheets: Dict[str, pd.DataFrame], model: str, prompt_version: str) -> str:
+    """بصمة محتوى الأوراق بعد التوحيد مع النموذج وإصدار نص الطلب
+
+    لا تتأثر البصمة بإعادة حفظ الملف: تُحذف الصفوف والأعمدة الفارغة في الأطراف،
+    وتُوحد الأرقام الصحيحة (1 و 1.0) والمسافات والعناوين الفارغة (Unnamed).
+    """
+    digest = hashlib.sha256(f"{model}\x1e{prompt_version}".encode('utf-8'))
+    for name, data in sheets.items():
+        cells = pd.concat([pd.DataFrame([list(data.columns)]), pd.DataFrame(data.to_numpy(dtype=object))],
+                          ignore_index=True)
+        numbers = pd.DataFrame({
+            column: pd.to_numeric(cells[column], errors='coerce') for column in cells.columns
+        })
+        whole = numbers.notna() & (numbers % 1 == 0)
+        # النطاق الآمن لـ int64؛ ما تجاوزه (مثل 1e20) يُكتب بدون كسور مباشرة
+        small = whole & (numbers.abs() < 2 ** 63)
+        cells = cells.mask(small, numbers.where(small).round().astype('Int64').astype(str), axis=None)
+        cells = cells.mask(whole & ~small, numbers.where(whole & ~small).apply(
+            lambda column: column.map(lambda value: '{:.0f}'.format(value) if pd.notna(value) else value)
+        ), axis=None)
+        cells = cells.where(cells.notna(), '').astype(str).apply(lambda column: column.str.strip())
+        cells = cells.mask(cells.apply(lambda column: column.str.match(r'^Unnamed: \d+')), '')
+
+        filled = cells != ''
+        rows = filled.any(axis=1).to_numpy().nonzero()[0]
+        columns = filled.any(axis=0).to_numpy().nonzero()[0]
+        digest.update(f"\x1d{name}\x1d".encode('utf-8'))
+        if len(rows):
+            cells = cells.iloc[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+            digest.update('\x1e'.join('\x1f'.join(row) for row in cells.to_numpy()).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AIResultCache:
+    """ذاكرة دائمة لنتائج استخراج الذكاء الاصطناعي في SQLite
+
+    المفتاح بصمة المحتوى (content_hash)، فإعادة رفع نفس الملف تُرجع النتيجة فوراً
+    دون طلب جديد. تنتهي صلاحية النتيجة بعد TTL، وعند تجاوز الحد الأقصى تُحذف
+    الأقدم استخداماً (LRU).
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str = AI_CACHE_PATH, max_entries: int = AI_CACHE_MAX_ENTRIES,
+                 ttl: float = AI_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.connections = ConnectionManager.for_path(path)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_table()
+
+    @classmethod
+    def shared(cls) -> 'AIResultCache':
+        """الذاكرة المشتركة للعملية (تبقى عداداتها بين إعادات تشغيل الصفحة)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _init_table(self):
+        try:
+            with self.connections.get_connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ai_results (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        prompt_version TEXT NOT NULL,
+                        result BLOB NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_results_accessed ON ai_results (accessed_at)')
+        except sqlite3.Error as e:
+            print(f"خطأ في إنشاء ذاكرة نتائج الذكاء الاصطناعي: {e}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """النتيجة المحفوظة للمفتاح إن كانت صالحة، أو None"""
+        now = time.time()
+        try:
+            with self.connections.get_connection() as conn:
+                row = conn.execute(
+                    'SELECT result FROM ai_results WHERE key = ? AND created_at > ?', (key, now - self.ttl)
+                ).fetchone()
+                if row:
+                    conn.execute('UPDATE ai_results SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            print(f"خطأ في قراءة ذاكرة نتائج الذكاء الاصطناعي: {e}")
+            row = None
+
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(zlib.decompress(row[0]).decode('utf-8')) if row else None
+
+    def put(self, key: str, result: Dict, model: str, prompt_version: str):
+        """حفظ نتيجة ثم حذف المنتهية وما زاد عن الحد الأقصى"""
+        now = time.time()
+        blob = zlib.compress(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+        try:
+            with self.connections.get_connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO ai_results (key, model, prompt_version, result, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (key, model, prompt_version, blob, now, now))
+                conn.execute('DELETE FROM ai_results WHERE created_at <= ?', (now - self.ttl,))
+                conn.execute('''
+                    DELETE FROM ai_results WHERE key NOT IN (
+                        SELECT key FROM ai_results ORDER BY accessed_at DESC LIMIT ?
+                    )
+                ''', (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"خطأ في حفظ نتيجة الذكاء الاصطناعي: {e}")
+
+    def invalidate(self, key: Optional[str] = None, model: Optional[str] = None) -> int:
+        """حذف نتيجة مفتاح أو كل نتائج نموذج أو كل الذاكرة، وإرجاع عدد المحذوف"""
+        conditions, params = [], []
+        if key is not None:
+            conditions.append('key = ?')
+            params.append(key)
+        if model is not None:
+            conditions.append('model = ?')
+            params.append(model)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        try:
+            with self.connections.get_connection() as conn:
+                return conn.execute(f'DELETE FROM ai_results{where}', params).rowcount
+        except sqlite3.Error as e:
+            print(f"خطأ في حذف نتائج الذكاء الاصطناعي المحفوظة: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """عدادات الإصابة والإخفاق وعدد النتائج المحفوظة"""
+        try:
+            entries = self.connections.get_connection().execute('SELECT COUNT(*) FROM ai_results').fetchone()[0]
+        except sqlite3.Error:
+            entries = 0
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
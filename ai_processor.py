@@ -1,19 +1,204 @@
 import requests
 import json
+import threading
+import time
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
-from config import AI_API_KEY, AI_API_URL, AI_MODEL, OPENROUTER_HEADERS
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from config import (
+    AI_API_KEY, AI_API_URL, AI_MODEL, OPENROUTER_HEADERS, AI_MAX_CONCURRENCY, AI_REQUESTS_PER_MINUTE,
+    AI_CHUNK_MAX_ROWS, AI_REQUEST_TIMEOUT
+)
+from timetable_parser import TimetableParser, normalize_text
+from ai_cache import AIResultCache, content_hash
+
+class RateLimiter:
+    """حد معدل الطلبات المشترك بين الخيوط (يسمح بدفعة أولى بحجم burst)"""
+    
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.burst = max(1, burst)
+        self._next = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """الانتظار حتى يحين دور طلب جديد"""
+        with self._lock:
+            now = time.monotonic()
+            due = max(self._next, now)
+            start = max(now, due - (self.burst - 1) * self.interval)
+            self._next = due + self.interval
+        if start > now:
+            time.sleep(start - now)
 
 class AIProcessor:
+    # غيّره عند تعديل نص الطلب حتى لا تُستخدم النتائج المحفوظة بالنص القديم
+    PROMPT_VERSION = "1"
+    # مشترك بين كل النسخ لأن حد المعدل على مفتاح API
+    rate_limiter = RateLimiter(AI_REQUESTS_PER_MINUTE, burst=AI_MAX_CONCURRENCY)
+    
     def __init__(self):
         self.api_key = AI_API_KEY
         self.api_url = AI_API_URL
+        self.parser = TimetableParser()
+        self.cache = AIResultCache.shared()
+        # مصدر آخر نتيجة: local أو cache أو ai أو fallback
+        self.last_source: Optional[str] = None
+        # أسماء الأجزاء التي فشل تحليلها في آخر معالجة
+        self.failed_chunks: List[str] = []
+    
+    def process_excel_to_json(self, excel_data: Union[pd.DataFrame, Dict[str, pd.DataFrame]],
+                              refresh: bool = False) -> Dict:
+        """تحويل ملف Excel (ورقة أو كل الأوراق حسب الاسم) إلى JSON
+        
+        الأوراق بتنسيق معروف تُحلل محلياً، والباقي يُقسم إلى أجزاء (ورقة أو كتلة
+        صفوف بين صفوف فارغة) تُرسل للذكاء الاصطناعي بالتوازي ثم تُدمج النتائج.
+        نتيجة كل جزء تُحفظ لنفس محتواه، و refresh يتجاهل النتائج المحفوظة ويحذفها.
+        """
+        sheets = excel_data if isinstance(excel_data, dict) else {'': excel_data}
+        self.failed_chunks = []
+        
+        parsed, unrecognized = self.parser.split(sheets)
+        if not unrecognized:
+            if parsed:
+                self.last_source = 'local'
+                return parsed
+            # ملف بلا بيانات: يُرسل كما هو
+            unrecognized = sheets
+        
+        chunks = self._chunks(unrecognized)
+        with ThreadPoolExecutor(max_workers=max(1, min(AI_MAX_CONCURRENCY, len(chunks)))) as executor:
+            outcomes = list(executor.map(lambda chunk: self._extract_chunk(chunk, refresh), chunks))
+        
+        results = [parsed] if parsed else []
+        sources = set()
+        failed = []
+        for chunk, (result, source) in zip(chunks, outcomes):
+            if result is None:
+                failed.extend(chunk.items())
+            else:
+                results.append(result)
+                sources.add(source)
+        
+        if failed:
+            self.failed_chunks = [name for name, _ in failed]
+            if not results:
+                frames = [data for _, data in failed]
+                return self._create_fallback_data(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+            self.last_source = 'fallback'
+        else:
+            self.last_source = 'ai' if 'ai' in sources else 'cache'
+        return self._merge_results(results)
+    
+    def _chunks(self, sheets: Dict[str, pd.DataFrame]) -> List[Dict[str, pd.DataFrame]]:
+        """تقسيم الأوراق إلى أجزاء لا تتجاوز AI_CHUNK_MAX_ROWS صفاً
+        
+        يُقسم عند الصفوف الفارغة (الفاصل المعتاد بين كتل الفصول)، ولا تُقطع الكتلة
+        إلا إذا تجاوزت الحد وحدها.
+        """
+        chunks = []
+        for name, data in sheets.items():
+            text = data.astype(object).where(data.notna(), '').astype(str)
+            blank = (text.apply(lambda column: column.str.strip()) == '').all(axis=1).to_numpy()
+            rows = np.flatnonzero(~blank)
+            blocks = np.split(rows, np.flatnonzero(np.diff(np.cumsum(blank)[rows])) + 1) if len(rows) else []
+            
+            pieces, current = [], []
+            for block in blocks:
+                for start in range(0, len(block), AI_CHUNK_MAX_ROWS):
+                    part = list(block[start:start + AI_CHUNK_MAX_ROWS])
+                    if current and len(current) + len(part) > AI_CHUNK_MAX_ROWS:
+                        pieces.append(current)
+                        current = []
+                    current += part
+            if current:
+                pieces.append(current)
+            
+            if len(pieces) <= 1:
+                chunks.append({name: data})
+                continue
+            for i, piece in enumerate(pieces, 1):
+                label = f"{name} - جزء {i}" if name else f"جزء {i}"
+                chunks.append({label: data.iloc[piece]})
+        return chunks
+    
+    def _extract_chunk(self, chunk: Dict[str, pd.DataFrame], refresh: bool) -> Tuple[Optional[Dict], str]:
+        """نتيجة جزء واحد من الذاكرة المحفوظة أو من طلب جديد، مع مصدرها"""
+        key = content_hash(chunk, AI_MODEL, self.PROMPT_VERSION)
+        if refresh:
+            self.cache.invalidate(key)
+        else:
+            cached = self.cache.get(key)
+            if cached:
+                return cached, 'cache'
+        
+        self.rate_limiter.acquire()
+        result = self._request_extraction(chunk)
+        if result is not None:
+            self.cache.put(key, result, AI_MODEL, self.PROMPT_VERSION)
+        return result, 'ai'
+    
+    def _merge_results(self, results: List[Dict]) -> Dict:
+        """دمج نتائج الأجزاء: جداول الفصول ثم المعلمين بعد توحيد أسمائهم ثم الأكواد"""
+        classes: Dict[str, Dict[str, List[Dict]]] = {}
+        for result in results:
+            for class_name, days in ((result.get('schedule') or {}).get('classes') or {}).items():
+                if not isinstance(days, dict):
+                    continue
+                target = classes.setdefault(str(class_name).strip(), {})
+                for day, periods in days.items():
+                    if not isinstance(periods, list):
+                        continue
+                    slots = target.setdefault(day, [])
+                    taken = {slot.get('period') for slot in slots}
+                    for period in periods:
+                        if isinstance(period, dict) and period.get('period') not in taken:
+                            slots.append(period)
+                            taken.add(period.get('period'))
+        
+        # كل ذكر لمعلم: (الاسم، المواد، الفصول، الحصة إن جاء من الجدول)
+        mentions = []
+        for result in results:
+            for teacher in result.get('teachers') or []:
+                if isinstance(teacher, dict) and teacher.get('name'):
+                    mentions.append((teacher['name'], self._as_list(teacher.get('subjects')),
+                                     self._as_list(teacher.get('classes')), None))
+        for class_name, days in classes.items():
+            for periods in days.values():
+                for period in periods:
+                    if period.get('teacher'):
+                        mentions.append((str(period['teacher']), self._as_list(period.get('subject')), [class_name], period))
+        
+        # نفس المعلم بكتابات مختلفة (همزات، مسافات) في أجزاء مختلفة يُدمج تحت أول كتابة
+        teachers: Dict[str, Dict] = {}
+        keys = normalize_text(pd.Series([str(mention[0]) for mention in mentions], dtype=object))
+        for key, (name, subjects, teacher_classes, period) in zip(keys, mentions):
+            teacher = teachers.setdefault(key, {"name": ' '.join(str(name).split()), "subjects": [], "classes": []})
+            teacher['subjects'] += [s for s in dict.fromkeys(subjects) if s and s not in teacher['subjects']]
+            teacher['classes'] += [c for c in dict.fromkeys(teacher_classes) if c and c not in teacher['classes']]
+            if period is not None:
+                period['teacher'] = teacher['name']
+        
+        return self._validate_and_enhance_data({"teachers": list(teachers.values()), "schedule": {"classes": classes}})
+    
+    @staticmethod
+    def _as_list(value) -> List[str]:
+        """قائمة نصوص من قيمة قد يُرجعها النموذج نصاً مفرداً"""
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, list):
+            return [str(item) for item in value if isinstance(item, (str, int, float))]
+        return []
     
-    def process_excel_to_json(self, excel_data: pd.DataFrame) -> Dict:
-        """تحويل ملف Excel إلى JSON باستخدام الذكاء الاصطناعي"""
+    def _request_extraction(self, sheets: Dict[str, pd.DataFrame]) -> Optional[Dict]:
+        """تحويل الأوراق إلى JSON باستخدام الذكاء الاصطناعي، أو None عند الفشل"""
         
         # تحويل البيانات إلى نص
-        excel_text = excel_data.to_string()
+        excel_text = "\n\n".join(
+            f"ورقة: {name}\n{data.to_string()}" if name else data.to_string()
+            for name, data in sheets.items()
+        )
         
         prompt = f"""
         أنت Grok، مساعد ذكي متخصص في تحليل الجداول المدرسية. قم بتحليل البيانات التالية وتحويلها إلى JSON منظم.
@@ -88,7 +273,7 @@ class AIProcessor:
                 "presence_penalty": 0.1
             }
             
-            response = requests.post(self.api_url, headers=headers, json=data)
+            response = requests.post(self.api_url, headers=headers, json=data, timeout=AI_REQUEST_TIMEOUT)
             
             if response.status_code == 200:
                 result = response.json()
@@ -104,15 +289,16 @@ class AIProcessor:
                     parsed_data = json.loads(json_str)
                     return self._validate_and_enhance_data(parsed_data)
                     
-                except json.JSONDecodeError:
-                    # في حالة فشل التحليل، إنشاء بيانات افتراضية
-                    return self._create_fallback_data(excel_data)
+                except json.JSONDecodeError as e:
+                    print(f"تعذر تحليل JSON من استجابة AI: {e}")
+                    return None
             else:
-                return self._create_fallback_data(excel_data)
+                print(f"خطأ في طلب AI: {response.status_code}")
+                return None
                 
         except Exception as e:
             print(f"خطأ في معالجة AI: {e}")
-            return self._create_fallback_data(excel_data)
+            return None
     
     def _validate_and_enhance_data(self, data: Dict) -> Dict:
         """التحقق من صحة البيانات وتحسينها"""
@@ -131,6 +317,7 @@ class AIProcessor:
     
     def _create_fallback_data(self, excel_data: pd.DataFrame) -> Dict:
         """إنشاء بيانات افتراضية في حالة فشل AI"""
+        self.last_source = 'fallback'
         
         # استخراج أسماء المعلمين من البيانات
         teachers = []
@@ -0,0 +1,67 @@
+"""
+قياس أداء المزامنة مع Firebase باستخدام مصدر الذاكرة (بدون اتصال)
+
+مثال:
+    python benchmark_sync.py --teachers 2000 --latency-ms 40
+"""
+import argparse
+import os
+import tempfile
+import time
+from database import DatabaseManager
+from firebase_backends import MemoryBackend
+from firebase_manager import FirebaseManager
+
+
+def make_teachers(count: int):
+    return [
+        {
+            'name': f"معلم {i}",
+            'teacher_code': f"T{i:04d}",
+            'supervisor_code': f"S{i:04d}",
+            'subjects': ["رياضيات"],
+            'classes': [f"{i % 12 + 1}/{i % 4 + 1}"],
+            'is_supervisor_enabled': True
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def measure(label: str, backend: MemoryBackend, action):
+    backend.client.reset_stats()
+    start = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - start
+    stats = backend.client.stats
+    print(f"{label:<28} {elapsed * 1000:>9.1f} ms  طلبات={stats['round_trips']:<5} "
+          f"قراءات={stats['reads']:<6} كتابات={stats['writes']:<6} حذف={stats['deletes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء المزامنة مع Firebase دون اتصال")
+    parser.add_argument('--teachers', type=int, default=1000, help="عدد المعلمين")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="تأخير كل طلب بالمللي ثانية")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="تذبذب التأخير بالمللي ثانية")
+    parser.add_argument('--seed', type=int, default=1, help="بذرة التذبذب لنتائج قابلة للتكرار")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, 'benchmark.db'))
+        backend = MemoryBackend(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+        firebase = FirebaseManager(db, backend=backend)
+        teachers = make_teachers(args.teachers)
+
+        print(f"{args.teachers} معلم، تأخير {args.latency_ms} ms لكل طلب")
+        measure("مزامنة أولى", backend, lambda: firebase.sync_teachers(teachers))
+        measure("مزامنة بدون تغيير", backend, lambda: firebase.sync_teachers(teachers))
+
+        teachers[0]['is_supervisor_enabled'] = False
+        measure("تغيير معلم واحد", backend, lambda: firebase.sync_teachers(teachers))
+        measure("مزامنة كاملة قسرية", backend, lambda: firebase.sync_teachers(teachers, force_full=True))
+        measure("قراءة المعلمين", backend, firebase.get_teachers)
+        measure("حذف كل البيانات", backend, firebase.delete_all_data)
+        db.connections.close()
+
+
+if __name__ == "__main__":
+    main()
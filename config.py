@@ -5,11 +5,36 @@ load_dotenv()
 
 # Firebase Configuration - استخدام ملف JSON
 FIREBASE_SERVICE_ACCOUNT_PATH = "alnassr-ab9fd-firebase-adminsdk-fbsvc-24f5614874.json"
+FIREBASE_BACKEND = os.getenv("FIREBASE_BACKEND", "firestore")  # firestore أو memory للعمل دون اتصال
+FIREBASE_MEMORY_LATENCY_MS = float(os.getenv("FIREBASE_MEMORY_LATENCY_MS", "0"))  # تأخير مصطنع لكل طلب في مصدر الذاكرة
+FIREBASE_CONNECT_TIMEOUT = 15  # ثوانٍ انتظار اكتمال الاتصال عند أول استخدام لـ Firebase
+FIREBASE_CONNECT_RETRY_SECONDS = 60  # أقل فاصل قبل إعادة محاولة اتصال فاشل
+FIRESTORE_BATCH_LIMIT = 500  # أقصى عدد عمليات في دفعة كتابة واحدة
+FIRESTORE_SHARD_BATCH_SIZE = 20  # عدد مستندات الفصول في كل دفعة عند رفع الجدول
+FIRESTORE_WRITE_WORKERS = 4  # عدد الدفعات المرسلة بالتوازي
+FIRESTORE_DELETE_PAGE_SIZE = 500  # عدد المفاتيح المقروءة في كل صفحة أثناء الحذف الجماعي
+FIRESTORE_DELETE_WORKERS = 4  # عدد المجموعات المحذوفة بالتوازي
+FIRESTORE_BULK_MAX_OPS_PER_SECOND = 1000  # سقف معدل عمليات BulkWriter
+FIRESTORE_CACHE_TTL_SECONDS = 60  # صلاحية قراءات Firebase المحفوظة غير المراقبة بمستمع
+FIRESTORE_COUNT_TTL_SECONDS = 15  # صلاحية أعداد المستندات وفحوص الوجود المحفوظة
+FIRESTORE_CACHE_PATH = None  # ملف اختياري لحفظ آخر قراءات Firebase بين تشغيلات التطبيق
+SYNC_POLL_SECONDS = 5  # الفاصل بين فحوص صندوق الإرسال في الخلفية
+SYNC_RETRY_BASE_SECONDS = 2  # أول تأخير بعد فشل المزامنة (يتضاعف مع كل محاولة)
+SYNC_RETRY_MAX_SECONDS = 300  # أقصى تأخير بين محاولات المزامنة
+SYNC_PULL_SECONDS = 60  # الفاصل بين عمليات سحب التغييرات من Firebase
+SYNC_PULL_PAGE_SIZE = 500  # عدد المستندات في كل صفحة سحب (تُطبق في معاملة واحدة)
 
 # AI API Configuration (استخدام OpenRouter مع Grok-4-Fast المجاني)
 AI_API_KEY = os.getenv("OPENROUTER_API_KEY")
 AI_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 AI_MODEL = "x-ai/grok-4-fast:free"
+AI_CACHE_PATH = "ai_cache.db"  # ملف حفظ نتائج الذكاء الاصطناعي لإعادة رفع نفس الجدول
+AI_CACHE_MAX_ENTRIES = 500  # أقصى عدد نتائج أجزاء محفوظة (تُحذف الأقدم استخداماً)
+AI_CACHE_TTL_SECONDS = 30 * 24 * 3600  # صلاحية النتيجة المحفوظة
+AI_MAX_CONCURRENCY = 4  # أقصى عدد طلبات متزامنة عند تقسيم الملف إلى أجزاء
+AI_REQUESTS_PER_MINUTE = 20  # حد الطلبات في الدقيقة (حد الخطة المجانية)
+AI_CHUNK_MAX_ROWS = 60  # أقصى عدد صفوف في كل جزء يُرسل في طلب واحد
+AI_REQUEST_TIMEOUT = 120  # ثوانٍ انتظار كل طلب
 
 # OpenRouter Headers
 OPENROUTER_HEADERS = {
@@ -19,6 +44,17 @@ OPENROUTER_HEADERS = {
 
 # Database Configuration
 DATABASE_PATH = "school_data.db"
+DATABASE_CACHE_SIZE_KB = 16384  # حجم ذاكرة الصفحات لكل اتصال
+DATABASE_BUSY_TIMEOUT = 10.0  # ثوانٍ انتظار القفل قبل الفشل
+DATABASE_STATEMENT_CACHE = 256  # عدد الاستعلامات المحضرة المحفوظة لكل اتصال
+DATABASE_PAGE_SIZE = 500  # عدد الصفوف في كل صفحة عند القراءة التدريجية
+DATABASE_READ_CACHE_SIZE = 256  # أقصى عدد نتائج قراءة محفوظة في الذاكرة
+
+# Schedule Versions Configuration
+SCHEDULE_COMPRESSION_LEVEL = 9  # مستوى ضغط zlib لنسخ الجدول
+SCHEDULE_RETENTION = 10  # عدد نسخ الجدول المحتفظ بها
+SCHEDULE_DELTA_ENABLED = True  # تخزين النسخ الجديدة كفرق عن النسخة السابقة عند الإمكان
+SCHEDULE_DELTA_MAX_CHAIN = 5  # أقصى طول لسلسلة الفروق قبل تخزين نسخة كاملة
 
 # App Configuration
 APP_TITLE = "نظام إدارة المدرسة - لوحة التحكم"
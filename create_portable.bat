@@ -13,7 +13,11 @@ echo [2/4] نسخ الملفات...
 copy *.py portable_admin\
 copy requirements.txt portable_admin\
 if exist ".streamlit" xcopy /s /e .streamlit portable_admin\.streamlit\
+rem دمج سجلات WAL في ملفات قواعد البيانات قبل نسخها، ونسخ ما تبقى منها إن كان التطبيق يعمل
+python -c "import glob, sqlite3; [sqlite3.connect(path).execute('PRAGMA wal_checkpoint(TRUNCATE)') for path in glob.glob('*.db')]"
 if exist "*.db" copy *.db portable_admin\
+if exist "*.db-wal" copy *.db-wal portable_admin\
+if exist "*.db-shm" copy *.db-shm portable_admin\
 
 echo.
 echo [3/4] إنشاء ملف التشغيل...
@@ -1,16 +1,203 @@
+import os
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+import time
+import weakref
+import functools
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Iterator, Sequence, Callable, Any, Union
+from config import (
+    DATABASE_CACHE_SIZE_KB, DATABASE_BUSY_TIMEOUT, DATABASE_STATEMENT_CACHE, DATABASE_PAGE_SIZE,
+    DATABASE_READ_CACHE_SIZE, SCHEDULE_RETENTION, SCHEDULE_DELTA_ENABLED, SCHEDULE_DELTA_MAX_CHAIN
+)
+import schedule_versions
+
+
+class ConnectionManager:
+    """مدير اتصالات SQLite طويلة العمر (اتصال واحد لكل خيط) وذاكرة القراءة المشتركة
+    
+    يعيد الاتصال إلى مجموعة الاتصالات الخاملة عند انتهاء الخيط، فتستعمله
+    الخيوط الجديدة (مثل كل إعادة تشغيل لـ Streamlit) بدلاً من فتح اتصال جديد.
+    """
+    
+    _managers = {}
+    _managers_lock = threading.Lock()
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.schema_ready = False
+        self.schema_lock = threading.Lock()
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+        
+        # ذاكرة القراءة: تُبطل كلها عند تغير الجيل
+        self.generation = 0
+        self._versions = {}
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    @classmethod
+    def for_path(cls, db_path: str) -> 'ConnectionManager':
+        """الحصول على المدير المشترك لملف قاعدة البيانات داخل العملية"""
+        key = os.path.abspath(db_path)
+        with cls._managers_lock:
+            manager = cls._managers.get(key)
+            if manager is None:
+                manager = cls(db_path)
+                cls._managers[key] = manager
+            return manager
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """إرجاع اتصال الخيط الحالي وإنشاؤه عند أول استخدام"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = sqlite3.connect(
+                    self.db_path,
+                    timeout=DATABASE_BUSY_TIMEOUT,
+                    cached_statements=DATABASE_STATEMENT_CACHE,
+                    check_same_thread=False
+                )
+                self._configure(conn)
+            self._track(conn)
+            self._local.conn = conn
+            weakref.finalize(threading.current_thread(), self._release, conn)
+        return conn
+    
+    def _track(self, conn: sqlite3.Connection):
+        """تسجيل حالة البيانات الأولى للاتصال قبل أي كتابة منه
+        
+        بدونها تُسجل الحالة عند أول قراءة مخزنة فقط، فلا تُكتشف كتابة سبقتها من
+        نفس الاتصال وتُرجع الذاكرة قيمة قديمة. الاتصال الذي لم يُتتبع من قبل لم
+        يشهد التغييرات السابقة، فلا يمكن الوثوق بالذاكرة.
+        """
+        with self._lock:
+            if conn in self._versions:
+                return
+        version = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+        with self._lock:
+            self._versions[conn] = version
+        self.invalidate()
+    
+    def _configure(self, conn: sqlite3.Connection):
+        """ضبط إعدادات الأداء للاتصال"""
+        # يجب أن يسبق WAL وإنشاء الجداول ليسري على ملف جديد، ولا أثر له على ملف قائم
+        # (يُحوَّل في reclaim_space). يسمح بإرجاع المساحة تدريجياً
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(DATABASE_CACHE_SIZE_KB)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+    
+    def _release(self, conn: sqlite3.Connection):
+        """إرجاع اتصال خيط منتهٍ إلى مجموعة الاتصالات الخاملة"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._idle.append(conn)
+    
+    def close(self):
+        """إغلاق اتصال الخيط الحالي"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                self._versions.pop(conn, None)
+            conn.close()
+            self._local.conn = None
+    
+    def invalidate(self):
+        """إبطال كل القيم المخزنة"""
+        with self._lock:
+            self.generation += 1
+            self._cache.clear()
+    
+    def current_generation(self) -> int:
+        """جيل البيانات كما يراه اتصال الخيط الحالي
+        
+        يتغير PRAGMA data_version عند أي كتابة من اتصال آخر (عملية أخرى أو
+        خيط آخر)، ويتغير total_changes عند كتابة هذا الاتصال نفسه.
+        """
+        conn = self.get_connection()
+        version = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+        with self._lock:
+            last = self._versions.get(conn)
+            self._versions[conn] = version
+        if last is not None and last != version:
+            self.invalidate()
+        return self.generation
+    
+    def cached(self, key, loader: Callable[[], Any]) -> Any:
+        """إرجاع قيمة مخزنة صالحة أو تحميلها وتخزينها (LRU محدود)"""
+        generation = self.current_generation()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == generation:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+            self.cache_misses += 1
+        
+        value = loader()
+        with self._lock:
+            if generation == self.generation:
+                self._cache[key] = (generation, value)
+                self._cache.move_to_end(key)
+                while len(self._cache) > DATABASE_READ_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return value
+
+
+def cached_read(method):
+    """تخزين نتيجة دالة قراءة حتى تتغير قاعدة البيانات
+    
+    القيم المرجعة مشتركة بين الجلسات ويجب عدم تعديلها.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__,) + args + tuple(sorted(kwargs.items()))
+        return self.connections.cached(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
 
 class DatabaseManager:
+    # العمليات التي تغير جداول المعلمين المنشورة لتطبيق الجوال
+    TIMETABLE_SOURCES = ('teachers', 'schedule', 'substitutes')
+    # أعمدة جدول المعلمين المسموح باختيارها في iter_teachers
+    TEACHER_COLUMNS = (
+        'id', 'name', 'teacher_code', 'supervisor_code',
+        'subjects', 'classes', 'is_supervisor_enabled', 'created_at'
+    )
+    
     def __init__(self, db_path: str = "school_data.db"):
         self.db_path = db_path
-        self.init_database()
+        self.connections = ConnectionManager.for_path(db_path)
+        self.ensure_schema()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """الحصول على الاتصال المشترك لهذا الخيط"""
+        return self.connections.get_connection()
+    
+    def ensure_schema(self):
+        """إنشاء الجداول مرة واحدة فقط لكل عملية"""
+        if self.connections.schema_ready:
+            return
+        with self.connections.schema_lock:
+            if not self.connections.schema_ready:
+                self.init_database()
+                self.connections.schema_ready = True
     
     def init_database(self):
         """إنشاء قاعدة البيانات والجداول"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # جدول المعلمين
@@ -63,52 +250,506 @@ class DatabaseManager:
                 )
             ''')
             
+            # جدول حصص الجدول المدرسي (صف لكل حصة)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schedule_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    schedule_id INTEGER NOT NULL,
+                    class_name TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    period_index INTEGER NOT NULL,
+                    subject TEXT,
+                    teacher_name TEXT,
+                    teacher_id INTEGER,
+                    FOREIGN KEY (schedule_id) REFERENCES schedules (id),
+                    FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_schedule_entries_class
+                ON schedule_entries (schedule_id, class_name, day, period_index)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_schedule_entries_teacher
+                ON schedule_entries (schedule_id, teacher_name, day, period_index)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_schedule_entries_slot
+                ON schedule_entries (schedule_id, day, period, teacher_name)
+            ''')
+            
+            # جداول ربط المعلمين بالمواد والفصول
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS teacher_subjects (
+                    teacher_id INTEGER NOT NULL,
+                    subject TEXT NOT NULL,
+                    PRIMARY KEY (teacher_id, subject),
+                    FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_teacher_subjects_subject
+                ON teacher_subjects (subject, teacher_id)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS teacher_classes (
+                    teacher_id INTEGER NOT NULL,
+                    class_name TEXT NOT NULL,
+                    PRIMARY KEY (teacher_id, class_name),
+                    FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_teacher_classes_class
+                ON teacher_classes (class_name, teacher_id)
+            ''')
+            
+            # فهارس الحضور: سجل واحد لكل معلم في اليوم + فهارس مغطية للاستعلام بالمدى
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_attendance_teacher_date'")
+            if cursor.fetchone() is None:
+                cursor.execute('''
+                    DELETE FROM attendance WHERE id NOT IN (
+                        SELECT MAX(id) FROM attendance GROUP BY teacher_id, date
+                    )
+                ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_teacher_date
+                ON attendance (teacher_id, date)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_attendance_teacher_cover
+                ON attendance (teacher_id, date, is_present)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_attendance_date_cover
+                ON attendance (date, teacher_id, is_present)
+            ''')
+            
+            # فهرس الحصص الاحتياطية حسب اليوم، ويغطي العبء الأسبوعي (مدى تواريخ لكل معلم)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_substitute_classes_date_teacher
+                ON substitute_classes (date, substitute_teacher_id)
+            ''')
+            # فهارس سابقة: الأول يغطيه الفهرس أعلاه، والثاني برقم الأسبوع الذي لم يعد يُستعلم به
+            cursor.execute('DROP INDEX IF EXISTS idx_substitute_classes_date')
+            cursor.execute('DROP INDEX IF EXISTS idx_substitute_classes_week')
+            
+            # تعبئة جداول الربط من أعمدة JSON القديمة
+            cursor.execute('''
+                SELECT EXISTS (SELECT 1 FROM teacher_subjects) OR EXISTS (SELECT 1 FROM teacher_classes)
+            ''')
+            if not cursor.fetchone()[0]:
+                cursor.execute('SELECT teacher_code, subjects, classes FROM teachers')
+                self._replace_teacher_links(cursor, [
+                    (code, json.loads(subjects) if subjects else [], json.loads(classes) if classes else [])
+                    for code, subjects, classes in cursor.fetchall()
+                ])
+            
+            # نسخ الجداول المضغوطة حسب بصمة المحتوى + مؤشر الجدول النشط
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schedule_blobs (
+                    content_hash TEXT PRIMARY KEY,
+                    encoding TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    base_hash TEXT,
+                    chain_depth INTEGER NOT NULL DEFAULT 0,
+                    raw_size INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS app_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            
+            # صندوق الإرسال: عمليات المزامنة المعلقة مع Firebase (صف واحد لكل مفتاح دمج)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    coalesce_key TEXT UNIQUE NOT NULL,
+                    payload TEXT,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sync_outbox_due
+                ON sync_outbox (next_attempt_at)
+            ''')
+            
+            # بصمات آخر نسخة مرفوعة من كل مستند في Firebase
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_manifest (
+                    collection TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (collection, doc_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('PRAGMA table_info(schedules)')
+            if 'content_hash' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE schedules ADD COLUMN content_hash TEXT')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_schedules_hash ON schedules (content_hash)')
+            self._migrate_schedule_storage(cursor)
+            
+            # تعبئة الحصص للجدول النشط المحفوظ قبل إضافة الجدول الجديد
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is not None:
+                cursor.execute('SELECT 1 FROM schedule_entries WHERE schedule_id = ? LIMIT 1', (schedule_id,))
+                if cursor.fetchone() is None:
+                    self._insert_schedule_entries(cursor, schedule_id, self._load_schedule_version(cursor, schedule_id))
+            
             conn.commit()
     
+    def _get_state(self, cursor: sqlite3.Cursor, key: str) -> Optional[str]:
+        """قراءة قيمة من جدول الحالة"""
+        cursor.execute('SELECT value FROM app_state WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def _set_state(self, cursor: sqlite3.Cursor, key: str, value):
+        """كتابة قيمة في جدول الحالة (None للحذف)"""
+        if value is None:
+            cursor.execute('DELETE FROM app_state WHERE key = ?', (key,))
+        else:
+            cursor.execute('''
+                INSERT INTO app_state (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', (key, str(value)))
+    
+    def _active_schedule_id(self, cursor: sqlite3.Cursor) -> Optional[int]:
+        """معرّف الجدول النشط الحالي"""
+        value = self._get_state(cursor, 'active_schedule_id')
+        return int(value) if value is not None else None
+    
+    def _migrate_schedule_storage(self, cursor: sqlite3.Cursor):
+        """نقل الجداول القديمة (JSON نصي) إلى النسخ المضغوطة وتعيين مؤشر التفعيل"""
+        cursor.execute('SELECT id, schedule_data FROM schedules WHERE content_hash IS NULL ORDER BY id')
+        for schedule_id, schedule_data in cursor.fetchall():
+            digest = self._store_schedule_blob(cursor, json.loads(schedule_data), delta=False)
+            cursor.execute(
+                "UPDATE schedules SET content_hash = ?, schedule_data = '' WHERE id = ?",
+                (digest, schedule_id)
+            )
+        
+        if self._get_state(cursor, 'active_schedule_id') is None:
+            cursor.execute('SELECT id FROM schedules WHERE is_active = 1 ORDER BY upload_date DESC, id DESC LIMIT 1')
+            row = cursor.fetchone()
+            if row:
+                self._set_state(cursor, 'active_schedule_id', row[0])
+    
+    def _store_schedule_blob(self, cursor: sqlite3.Cursor, schedule_data: Dict, delta: bool = True) -> str:
+        """تخزين نسخة مضغوطة مرة واحدة لكل محتوى وإرجاع بصمتها"""
+        raw = schedule_versions.canonical_bytes(schedule_data)
+        digest = schedule_versions.content_hash(raw)
+        cursor.execute('SELECT 1 FROM schedule_blobs WHERE content_hash = ?', (digest,))
+        if cursor.fetchone():
+            return digest
+        
+        # الأساس المقترح للفرق هو الجدول النشط الحالي
+        base = None
+        depth = 0
+        active_id = self._active_schedule_id(cursor) if delta and SCHEDULE_DELTA_ENABLED else None
+        if active_id is not None:
+            cursor.execute('''
+                SELECT b.content_hash, b.chain_depth FROM schedules s
+                JOIN schedule_blobs b ON b.content_hash = s.content_hash
+                WHERE s.id = ?
+            ''', (active_id,))
+            row = cursor.fetchone()
+            if row and row[1] < SCHEDULE_DELTA_MAX_CHAIN:
+                base = (row[0], self._load_schedule_blob(cursor, row[0]))
+                depth = row[1] + 1
+        
+        encoding, payload, base_hash = schedule_versions.encode_version(schedule_data, base)
+        cursor.execute('''
+            INSERT INTO schedule_blobs (content_hash, encoding, data, base_hash, chain_depth, raw_size)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (digest, encoding, payload, base_hash, depth if base_hash else 0, len(raw)))
+        return digest
+    
+    def _load_schedule_blob(self, cursor: sqlite3.Cursor, digest: str) -> Dict:
+        """فك ضغط نسخة (مع تطبيق سلسلة الفروق إن وجدت)"""
+        cursor.execute('SELECT encoding, data, base_hash FROM schedule_blobs WHERE content_hash = ?', (digest,))
+        encoding, payload, base_hash = cursor.fetchone()
+        data = json.loads(schedule_versions.decompress(payload))
+        if encoding == schedule_versions.ENCODING_DELTA:
+            return schedule_versions.apply_delta(self._load_schedule_blob(cursor, base_hash), data)
+        return data
+    
+    def _load_schedule_version(self, cursor: sqlite3.Cursor, schedule_id: int) -> Optional[Dict]:
+        """قراءة نسخة جدول حسب معرّفها"""
+        cursor.execute('SELECT content_hash FROM schedules WHERE id = ?', (schedule_id,))
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            return None
+        return self._load_schedule_blob(cursor, row[0])
+    
+    def _activate_schedule(self, cursor: sqlite3.Cursor, schedule_id: int, schedule_data: Optional[Dict] = None):
+        """نقل مؤشر التفعيل إلى نسخة وإعادة بناء حصصها المفهرسة"""
+        cursor.execute('UPDATE schedules SET is_active = 0 WHERE is_active = 1 AND id != ?', (schedule_id,))
+        cursor.execute('UPDATE schedules SET is_active = 1 WHERE id = ?', (schedule_id,))
+        self._set_state(cursor, 'active_schedule_id', schedule_id)
+        
+        cursor.execute('DELETE FROM schedule_entries WHERE schedule_id != ?', (schedule_id,))
+        cursor.execute('SELECT 1 FROM schedule_entries WHERE schedule_id = ? LIMIT 1', (schedule_id,))
+        if cursor.fetchone() is None:
+            if schedule_data is None:
+                schedule_data = self._load_schedule_version(cursor, schedule_id)
+            self._insert_schedule_entries(cursor, schedule_id, schedule_data or {})
+        self._enqueue_sync(cursor, 'schedule')
+    
+    def _apply_schedule_retention(self, cursor: sqlite3.Cursor):
+        """حذف النسخ الأقدم من حد الاحتفاظ والنسخ المضغوطة غير المستخدمة"""
+        cursor.execute('''
+            DELETE FROM schedules
+            WHERE id NOT IN (SELECT id FROM schedules ORDER BY id DESC LIMIT ?)
+              AND id IS NOT ?
+        ''', (SCHEDULE_RETENTION, self._active_schedule_id(cursor)))
+        
+        # النسخة المستخدمة كأساس لفرق تبقى ما دام الفرق موجوداً
+        while True:
+            cursor.execute('''
+                DELETE FROM schedule_blobs
+                WHERE content_hash NOT IN (SELECT content_hash FROM schedules WHERE content_hash IS NOT NULL)
+                  AND content_hash NOT IN (SELECT base_hash FROM schedule_blobs WHERE base_hash IS NOT NULL)
+            ''')
+            if cursor.rowcount <= 0:
+                break
+    
+    def _replace_teacher_links(self, cursor: sqlite3.Cursor, links: List[tuple]):
+        """إعادة كتابة صفوف المواد والفصول لمعلمين محددين: [(teacher_code, subjects, classes)]"""
+        codes = [(code,) for code, _, _ in links]
+        cursor.executemany(
+            'DELETE FROM teacher_subjects WHERE teacher_id = (SELECT id FROM teachers WHERE teacher_code = ?)', codes)
+        cursor.executemany(
+            'DELETE FROM teacher_classes WHERE teacher_id = (SELECT id FROM teachers WHERE teacher_code = ?)', codes)
+        cursor.executemany('''
+            INSERT OR IGNORE INTO teacher_subjects (teacher_id, subject)
+            VALUES ((SELECT id FROM teachers WHERE teacher_code = ?), ?)
+        ''', [(code, subject) for code, subjects, _ in links for subject in subjects])
+        cursor.executemany('''
+            INSERT OR IGNORE INTO teacher_classes (teacher_id, class_name)
+            VALUES ((SELECT id FROM teachers WHERE teacher_code = ?), ?)
+        ''', [(code, class_name) for code, _, classes in links for class_name in classes])
+    
+    def _insert_schedule_entries(self, cursor: sqlite3.Cursor, schedule_id: int, schedule_data: Dict):
+        """تفكيك JSON الجدول إلى صفوف في schedule_entries"""
+        classes = (schedule_data.get('schedule') or {}).get('classes') or {}
+        rows = []
+        for class_name, days in classes.items():
+            if not isinstance(days, dict):
+                continue
+            for day, periods in days.items():
+                if not isinstance(periods, list):
+                    continue
+                for index, period in enumerate(periods):
+                    if not isinstance(period, dict):
+                        continue
+                    rows.append((
+                        schedule_id, class_name, day,
+                        str(period.get('period', '')), index,
+                        period.get('subject', ''), period.get('teacher', '')
+                    ))
+        cursor.executemany('''
+            INSERT INTO schedule_entries
+                (schedule_id, class_name, day, period, period_index, subject, teacher_name, teacher_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT id FROM teachers WHERE name = ?7 LIMIT 1))
+        ''', rows)
+    
     def add_teacher(self, name: str, teacher_code: str, supervisor_code: str = None, 
                    subjects: List[str] = None, classes: List[str] = None) -> bool:
         """إضافة معلم جديد"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO teachers (name, teacher_code, supervisor_code, subjects, classes)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (name, teacher_code, supervisor_code, 
                      json.dumps(subjects or []), json.dumps(classes or [])))
+                self._replace_teacher_links(cursor, [(teacher_code, subjects or [], classes or [])])
+                self._enqueue_sync(cursor, 'teachers')
                 conn.commit()
                 return True
         except sqlite3.IntegrityError:
             return False
     
+    def upsert_teachers(self, teachers: List[Dict]) -> Union[Dict[str, int], bool]:
+        """إضافة أو تحديث مجموعة معلمين في معاملة واحدة حسب teacher_code
+        
+        تُرجع عدد الجديد والمحدث وغير المتغير، أو False عند الفشل (مثل تكرار
+        supervisor_code لمعلمين مختلفين) دون حفظ أي معلم.
+        """
+        rows = {}
+        for teacher in teachers:
+            code = teacher.get('teacher_code')
+            if not code:
+                continue
+            rows[code] = (
+                teacher.get('name', ''),
+                code,
+                teacher.get('supervisor_code') or None,
+                json.dumps(teacher.get('subjects') or []),
+                json.dumps(teacher.get('classes') or [])
+            )
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not rows:
+            return counts
+        
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT name, teacher_code, supervisor_code, subjects, classes FROM teachers')
+                existing = {row[1]: tuple(row) for row in cursor.fetchall() if row[1] in rows}
+                
+                # كتابة الصفوف الجديدة أو المتغيرة فقط
+                changed = []
+                for code, row in rows.items():
+                    if code not in existing:
+                        counts['inserted'] += 1
+                        changed.append(row)
+                    elif existing[code] != row:
+                        counts['updated'] += 1
+                        changed.append(row)
+                    else:
+                        counts['unchanged'] += 1
+                
+                cursor.executemany('''
+                    INSERT INTO teachers (name, teacher_code, supervisor_code, subjects, classes)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(teacher_code) DO UPDATE SET
+                        name = excluded.name,
+                        supervisor_code = excluded.supervisor_code,
+                        subjects = excluded.subjects,
+                        classes = excluded.classes
+                ''', changed)
+                self._replace_teacher_links(cursor, [
+                    (row[1], json.loads(row[3]), json.loads(row[4])) for row in changed
+                ])
+                if changed:
+                    self._enqueue_sync(cursor, 'teachers')
+                conn.commit()
+            return counts
+        except sqlite3.IntegrityError as e:
+            print(f"خطأ في حفظ المعلمين (رمز مشرف مكرر): {e}")
+            return False
+        except sqlite3.Error as e:
+            print(f"خطأ في حفظ المعلمين: {e}")
+            return False
+    
+    def iter_teachers(self, columns: Optional[Sequence[str]] = None, after_id: int = 0,
+                      limit: Optional[int] = None, page_size: int = DATABASE_PAGE_SIZE) -> Iterator[Dict]:
+        """قراءة المعلمين تدريجياً بترتيب المعرّف مع اختيار الأعمدة المطلوبة فقط
+        
+        تُقرأ الصفوف على صفحات (id > آخر معرّف) بدلاً من OFFSET، لذا تبقى
+        تكلفة كل صفحة ثابتة مهما كان موقعها.
+        """
+        columns = list(columns or self.TEACHER_COLUMNS)
+        unknown = set(columns) - set(self.TEACHER_COLUMNS)
+        if unknown:
+            raise ValueError(f"أعمدة غير معروفة: {', '.join(sorted(unknown))}")
+        selected = ['id'] + [column for column in columns if column != 'id']
+        query = f"SELECT {', '.join(selected)} FROM teachers WHERE id > ? ORDER BY id LIMIT ?"
+        
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch = page_size if remaining is None else min(page_size, remaining)
+            cursor = self._connect().execute(query, (after_id, batch))
+            rows = cursor.fetchall()
+            for row in rows:
+                teacher = dict(zip(selected, row))
+                if 'subjects' in teacher:
+                    teacher['subjects'] = json.loads(teacher['subjects']) if teacher['subjects'] else []
+                if 'classes' in teacher:
+                    teacher['classes'] = json.loads(teacher['classes']) if teacher['classes'] else []
+                if 'is_supervisor_enabled' in teacher:
+                    teacher['is_supervisor_enabled'] = bool(teacher['is_supervisor_enabled'])
+                if 'id' not in columns:
+                    del teacher['id']
+                yield teacher
+            if len(rows) < batch:
+                return
+            after_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    @cached_read
     def get_all_teachers(self) -> List[Dict]:
         """الحصول على جميع المعلمين"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM teachers')
-            teachers = []
-            for row in cursor.fetchall():
-                teacher = {
-                    'id': row[0],
-                    'name': row[1],
-                    'teacher_code': row[2],
-                    'supervisor_code': row[3],
-                    'subjects': json.loads(row[4]) if row[4] else [],
-                    'classes': json.loads(row[5]) if row[5] else [],
-                    'is_supervisor_enabled': bool(row[6]),
-                    'created_at': row[7]
-                }
-                teachers.append(teacher)
-            return teachers
+        return list(self.iter_teachers())
+    
+    @cached_read
+    def count_teachers(self) -> int:
+        """عدد المعلمين"""
+        cursor = self._connect().execute('SELECT COUNT(*) FROM teachers')
+        return cursor.fetchone()[0]
+
+    @cached_read
+    def get_teacher_names(self) -> List[tuple]:
+        """معرّفات وأسماء المعلمين فقط: [(id, name)]"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name FROM teachers ORDER BY id')
+            return cursor.fetchall()
+    
+    @cached_read
+    def count_teachers_per_subject(self) -> Dict[str, int]:
+        """عدد المعلمين لكل مادة"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT subject, COUNT(*) FROM teacher_subjects
+                GROUP BY subject
+                ORDER BY subject
+            ''')
+            return dict(cursor.fetchall())
+    
+    @cached_read
+    def count_teachers_per_class(self) -> Dict[str, int]:
+        """عدد المعلمين لكل فصل"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT class_name, COUNT(*) FROM teacher_classes
+                GROUP BY class_name
+                ORDER BY class_name
+            ''')
+            return dict(cursor.fetchall())
+    
+    @cached_read
+    def supervisor_counts(self) -> Dict[str, int]:
+        """إجمالي المعلمين والمشرفين والمشرفين النشطين في استعلام واحد"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*),
+                       COUNT(NULLIF(supervisor_code, '')),
+                       COALESCE(SUM(is_supervisor_enabled != 0), 0)
+                FROM teachers
+            ''')
+            total, supervisors, active = cursor.fetchone()
+            return {'total': total, 'supervisors': supervisors, 'active_supervisors': active}
     
     def update_supervisor_status(self, teacher_id: int, enabled: bool) -> bool:
         """تحديث حالة الإشراف للمعلم"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE teachers SET is_supervisor_enabled = ? WHERE id = ?
                 ''', (enabled, teacher_id))
+                self._enqueue_sync(cursor, 'teachers')
                 conn.commit()
                 return True
         except:
@@ -117,39 +758,611 @@ class DatabaseManager:
     def save_schedule(self, schedule_data: Dict) -> bool:
         """حفظ الجدول المدرسي"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                # إلغاء تفعيل الجداول السابقة
-                cursor.execute('UPDATE schedules SET is_active = 0')
-                # إضافة الجدول الجديد
+                digest = self._store_schedule_blob(cursor, schedule_data)
+                
+                # رفع نفس الملف مرة أخرى لا يضيف نسخة جديدة
+                active_id = self._active_schedule_id(cursor)
+                if active_id is not None:
+                    cursor.execute('SELECT content_hash FROM schedules WHERE id = ?', (active_id,))
+                    row = cursor.fetchone()
+                    if row and row[0] == digest:
+                        conn.commit()
+                        return True
+                
+                # إضافة الجدول الجديد وتفعيله
                 cursor.execute('''
-                    INSERT INTO schedules (schedule_data, is_active)
-                    VALUES (?, 1)
-                ''', (json.dumps(schedule_data),))
+                    INSERT INTO schedules (schedule_data, content_hash, is_active)
+                    VALUES ('', ?, 0)
+                ''', (digest,))
+                self._activate_schedule(cursor, cursor.lastrowid, schedule_data)
+                self._apply_schedule_retention(cursor)
                 conn.commit()
                 return True
         except:
             return False
     
+    @cached_read
+    def has_active_schedule(self) -> bool:
+        """هل يوجد جدول نشط (بدون فك ضغطه)"""
+        with self._connect() as conn:
+            return self._active_schedule_id(conn.cursor()) is not None
+    
+    @cached_read
     def get_active_schedule(self) -> Optional[Dict]:
         """الحصول على الجدول النشط"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return None
+            return self._load_schedule_version(cursor, schedule_id)
+    
+    def activate_schedule(self, schedule_id: int) -> bool:
+        """تفعيل نسخة سابقة من الجدول"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM schedules WHERE id = ?', (schedule_id,))
+                if cursor.fetchone() is None:
+                    return False
+                self._activate_schedule(cursor, schedule_id)
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            print(f"خطأ في تفعيل الجدول: {e}")
+            return False
+    
+    def list_schedule_versions(self) -> List[Dict]:
+        """نسخ الجدول المحفوظة من الأحدث للأقدم"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT s.id, s.upload_date, s.content_hash, s.is_active, b.encoding, LENGTH(b.data), b.raw_size
+                FROM schedules s
+                LEFT JOIN schedule_blobs b ON b.content_hash = s.content_hash
+                ORDER BY s.id DESC
+            ''')
+            return [
+                {'id': row[0], 'upload_date': row[1], 'content_hash': row[2], 'is_active': bool(row[3]),
+                 'encoding': row[4], 'stored_size': row[5], 'raw_size': row[6]}
+                for row in cursor.fetchall()
+            ]
+    
+    def link_schedule_teachers(self) -> int:
+        """ربط حصص الجدول النشط بمعرّفات المعلمين حسب الاسم"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return 0
+            cursor.execute('''
+                UPDATE schedule_entries
+                SET teacher_id = (SELECT id FROM teachers WHERE name = schedule_entries.teacher_name LIMIT 1)
+                WHERE schedule_id = ?
+            ''', (schedule_id,))
+            conn.commit()
+            return cursor.rowcount
+    
+    @cached_read
+    def get_schedule_classes(self) -> List[str]:
+        """أسماء الفصول في الجدول النشط"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return []
+            cursor.execute('''
+                SELECT class_name FROM schedule_entries
+                WHERE schedule_id = ?
+                GROUP BY class_name
+                ORDER BY MIN(id)
+            ''', (schedule_id,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    @cached_read
+    def get_class_schedule(self, class_name: str) -> Dict[str, List[Dict]]:
+        """جدول فصل واحد بنفس شكل JSON: {اليوم: [الحصص]}"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return {}
+            cursor.execute('''
+                SELECT day, period, subject, teacher_name FROM schedule_entries
+                WHERE schedule_id = ? AND class_name = ?
+                ORDER BY id
+            ''', (schedule_id, class_name))
+            days = {}
+            for day, period, subject, teacher in cursor.fetchall():
+                days.setdefault(day, []).append({'period': period, 'subject': subject, 'teacher': teacher})
+            return days
+    
+    @cached_read
+    def get_teacher_schedule(self, teacher_name: str) -> List[Dict]:
+        """جميع حصص معلم في الجدول النشط"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return []
+            cursor.execute('''
+                SELECT class_name, day, period, period_index, subject FROM schedule_entries
+                WHERE schedule_id = ? AND teacher_name = ?
+                ORDER BY day, period_index
+            ''', (schedule_id, teacher_name))
+            return [
+                {'class_name': row[0], 'day': row[1], 'period': row[2], 'period_index': row[3], 'subject': row[4]}
+                for row in cursor.fetchall()
+            ]
+    
+    @cached_read
+    def get_slot_entries(self, day: str, period: str) -> List[Dict]:
+        """جميع الحصص في يوم وحصة محددين"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return []
+            cursor.execute('''
+                SELECT class_name, subject, teacher_name, teacher_id FROM schedule_entries
+                WHERE schedule_id = ? AND day = ? AND period = ?
+            ''', (schedule_id, day, period))
+            return [
+                {'class_name': row[0], 'subject': row[1], 'teacher': row[2], 'teacher_id': row[3]}
+                for row in cursor.fetchall()
+            ]
+    
+    @cached_read
+    def get_free_teachers(self, day: str, period: str) -> List[Dict]:
+        """المعلمون غير المشغولين في يوم وحصة محددين"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            schedule_id = self._active_schedule_id(cursor)
+            cursor.execute('''
+                SELECT t.id, t.name, t.teacher_code FROM teachers t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM schedule_entries e
+                    WHERE e.schedule_id = ? AND e.day = ? AND e.period = ? AND e.teacher_name = t.name
+                )
+                ORDER BY t.id
+            ''', (schedule_id, day, period))
+            return [
+                {'id': row[0], 'name': row[1], 'teacher_code': row[2]}
+                for row in cursor.fetchall()
+            ]
+    
+    @cached_read
+    def get_schedule_entries(self, day: Optional[str] = None) -> List[Dict]:
+        """حصص الجدول النشط (لكل الأيام أو ليوم واحد)"""
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT schedule_data FROM schedules WHERE is_active = 1 ORDER BY upload_date DESC LIMIT 1')
-            result = cursor.fetchone()
-            if result:
-                return json.loads(result[0])
+            schedule_id = self._active_schedule_id(cursor)
+            if schedule_id is None:
+                return []
+            query = '''
+                SELECT day, period, period_index, class_name, subject, teacher_name
+                FROM schedule_entries WHERE schedule_id = ?
+            '''
+            params = [schedule_id]
+            if day is not None:
+                query += ' AND day = ?'
+                params.append(day)
+            cursor.execute(query + ' ORDER BY id', params)
+            return [
+                {'day': row[0], 'period': row[1], 'period_index': row[2],
+                 'class_name': row[3], 'subject': row[4], 'teacher': row[5]}
+                for row in cursor.fetchall()
+            ]
+
+    @staticmethod
+    def _date_key(value) -> str:
+        """تحويل التاريخ إلى نص ISO كما يُخزن في قاعدة البيانات"""
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    
+    @staticmethod
+    def week_start(day: date) -> date:
+        """بداية الأسبوع الدراسي (الأحد) الذي يقع فيه day"""
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    
+    def record_attendance(self, attendance_date, records: Dict[int, bool]) -> Optional[int]:
+        """تسجيل حضور يوم كامل دفعة واحدة (يمكن إعادة تنفيذه بأمان)"""
+        day = self._date_key(attendance_date)
+        rows = [(teacher_id, day, bool(present)) for teacher_id, present in records.items()]
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO attendance (teacher_id, date, is_present)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(teacher_id, date) DO UPDATE SET
+                        is_present = excluded.is_present
+                    WHERE attendance.is_present IS NOT excluded.is_present
+                ''', rows)
+                changed = cursor.rowcount
+                if changed:
+                    self._enqueue_sync(cursor, 'attendance', f'attendance:{day}', day)
+                conn.commit()
+                return changed
+        except sqlite3.Error as e:
+            print(f"خطأ في تسجيل الحضور: {e}")
             return None
     
+    def get_attendance_by_date(self, attendance_date) -> Dict[int, bool]:
+        """حضور جميع المعلمين في يوم محدد: {teacher_id: present}"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT teacher_id, is_present FROM attendance WHERE date = ?',
+                (self._date_key(attendance_date),)
+            )
+            return {teacher_id: bool(present) for teacher_id, present in cursor.fetchall()}
+    
+    def get_absent_teachers(self, attendance_date) -> List[int]:
+        """معرّفات المعلمين الغائبين في يوم محدد"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT teacher_id FROM attendance WHERE date = ? AND is_present = 0',
+                (self._date_key(attendance_date),)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_attendance_range(self, start_date, end_date) -> List[Dict]:
+        """سجلات الحضور بين تاريخين (شاملة)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT date, teacher_id, is_present FROM attendance
+                WHERE date BETWEEN ? AND ?
+                ORDER BY date, teacher_id
+            ''', (self._date_key(start_date), self._date_key(end_date)))
+            return [
+                {'date': row[0], 'teacher_id': row[1], 'is_present': bool(row[2])}
+                for row in cursor.fetchall()
+            ]
+    
+    def get_teacher_attendance(self, teacher_id: int, start_date, end_date) -> List[Dict]:
+        """سجل حضور معلم واحد بين تاريخين (شاملة)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT date, is_present FROM attendance
+                WHERE teacher_id = ? AND date BETWEEN ? AND ?
+                ORDER BY date
+            ''', (teacher_id, self._date_key(start_date), self._date_key(end_date)))
+            return [{'date': row[0], 'is_present': bool(row[1])} for row in cursor.fetchall()]
+    
+    def save_substitute_classes(self, substitute_date, substitutes: List[Dict]) -> bool:
+        """استبدال الحصص الاحتياطية ليوم محدد في معاملة واحدة"""
+        day = self._date_key(substitute_date)
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM substitute_classes WHERE date = ?', (day,))
+                cursor.executemany('''
+                    INSERT INTO substitute_classes
+                        (original_teacher_id, substitute_teacher_id, class_name, period, date, week_number)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (item.get('original_teacher_id'), item.get('substitute_teacher_id'),
+                     item.get('class_name'), item.get('period'), day, item.get('week_number'))
+                    for item in substitutes
+                ])
+                # الأسبوع يُعرّف بتاريخ بدايته لأن رقمه يتكرر كل سنة
+                week = self._date_key(self.week_start(date.fromisoformat(day)))
+                self._enqueue_sync(cursor, 'substitutes', f'substitutes:{week}', week)
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            print(f"خطأ في حفظ الحصص الاحتياطية: {e}")
+            return False
+    
+    def get_substitute_classes(self, substitute_date=None, from_date=None, to_date=None) -> List[Dict]:
+        """الحصص الاحتياطية ليوم محدد أو بين تاريخين (شاملة، وأي طرف اختياري)"""
+        if substitute_date is not None:
+            from_date = to_date = substitute_date
+        conditions, params = [], []
+        if from_date is not None:
+            conditions.append('date >= ?')
+            params.append(self._date_key(from_date))
+        if to_date is not None:
+            conditions.append('date <= ?')
+            params.append(self._date_key(to_date))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, original_teacher_id, substitute_teacher_id, class_name, period, date, week_number
+                FROM substitute_classes{where}
+                ORDER BY date, id
+            ''', params)
+            return [
+                {'id': row[0], 'original_teacher_id': row[1], 'substitute_teacher_id': row[2],
+                 'class_name': row[3], 'period': row[4], 'date': row[5], 'week_number': row[6]}
+                for row in cursor.fetchall()
+            ]
+    
+    def get_substitute_load(self, week_date: date, exclude_date=None) -> Dict[int, int]:
+        """عدد الحصص الاحتياطية لكل معلم خلال الأسبوع الدراسي الذي يقع فيه week_date
+
+        يُصفى بمدى التواريخ (الأحد إلى السبت) لا برقم الأسبوع، لأن الرقم يتكرر كل سنة.
+        """
+        week_start = self.week_start(week_date)
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT substitute_teacher_id, COUNT(*) FROM substitute_classes
+                WHERE date BETWEEN ? AND ? AND substitute_teacher_id IS NOT NULL AND date IS NOT ?
+                GROUP BY substitute_teacher_id
+            ''', (self._date_key(week_start), self._date_key(week_start + timedelta(days=6)),
+                  self._date_key(exclude_date) if exclude_date is not None else None))
+            return dict(cursor.fetchall())
+
+    def _enqueue_sync(self, cursor: sqlite3.Cursor, kind: str, key: Optional[str] = None, payload=None):
+        """تسجيل عملية مزامنة معلقة داخل معاملة الكتابة المحلية
+        
+        العمليات بنفس المفتاح تُدمج في صف واحد ويُزاد رقم نسختها، فلا يرفع
+        العامل إلا الحالة الأحدث. أي تغيير في مصادر جداول المعلمين يسجل
+        أيضاً عملية 'timetables' لإعادة نشرها.
+        """
+        cursor.execute('''
+            INSERT INTO sync_outbox (kind, coalesce_key, payload)
+            VALUES (?, ?, ?)
+            ON CONFLICT(coalesce_key) DO UPDATE SET
+                payload = excluded.payload,
+                version = version + 1,
+                attempts = 0,
+                next_attempt_at = 0,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (kind, key or kind, json.dumps(payload)))
+        if kind in self.TIMETABLE_SOURCES:
+            self._enqueue_sync(cursor, 'timetables')
+    
+    def enqueue_sync(self, kind: str, key: Optional[str] = None, payload=None) -> bool:
+        """تسجيل عملية مزامنة معلقة خارج أي كتابة محلية"""
+        try:
+            with self._connect() as conn:
+                self._enqueue_sync(conn.cursor(), kind, key, payload)
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            print(f"خطأ في تسجيل عملية المزامنة: {e}")
+            return False
+    
+    def get_due_sync_operations(self, limit: int = 20) -> List[Dict]:
+        """العمليات المعلقة التي حان وقت تنفيذها"""
+        cursor = self._connect().execute('''
+            SELECT id, kind, coalesce_key, payload, version, attempts FROM sync_outbox
+            WHERE next_attempt_at <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        ''', (time.time(), limit))
+        return [
+            {'id': row[0], 'kind': row[1], 'key': row[2], 'payload': json.loads(row[3]) if row[3] else None,
+             'version': row[4], 'attempts': row[5]}
+            for row in cursor.fetchall()
+        ]
+    
+    def complete_sync_operation(self, operation_id: int, version: int) -> bool:
+        """حذف عملية تمت مزامنتها (إلا إذا سُجلت نسخة أحدث أثناء التنفيذ)"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sync_outbox WHERE id = ? AND version = ?', (operation_id, version))
+            conn.commit()
+            return True
+    
+    def fail_sync_operation(self, operation_id: int, version: int, error: str, retry_at: float) -> bool:
+        """تسجيل فشل عملية وموعد إعادة المحاولة"""
+        with self._connect() as conn:
+            conn.execute('''
+                UPDATE sync_outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND version = ?
+            ''', (retry_at, error, operation_id, version))
+            conn.commit()
+            return True
+    
+    def get_sync_status(self) -> Dict:
+        """ملخص صندوق الإرسال لعرضه في الواجهة"""
+        cursor = self._connect().execute('''
+            SELECT COUNT(*), COALESCE(SUM(attempts > 0), 0), MIN(created_at),
+                   (SELECT last_error FROM sync_outbox WHERE last_error IS NOT NULL ORDER BY updated_at DESC LIMIT 1)
+            FROM sync_outbox
+        ''')
+        pending, retrying, oldest, last_error = cursor.fetchone()
+        return {'pending': pending, 'retrying': retrying, 'oldest': oldest, 'last_error': last_error}
+    
+    def get_sync_manifest(self, collection: str) -> Dict[str, str]:
+        """بصمات المستندات المرفوعة لمجموعة في Firebase: {doc_id: hash}"""
+        cursor = self._connect().execute(
+            'SELECT doc_id, content_hash FROM sync_manifest WHERE collection = ?', (collection,)
+        )
+        return dict(cursor.fetchall())
+    
+    def _update_sync_manifest(self, cursor: sqlite3.Cursor, collection: str, upserts: Dict[str, str],
+                              deletes: Sequence[str] = ()):
+        cursor.executemany('''
+            INSERT INTO sync_manifest (collection, doc_id, content_hash)
+            VALUES (?, ?, ?)
+            ON CONFLICT(collection, doc_id) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                synced_at = CURRENT_TIMESTAMP
+        ''', [(collection, doc_id, digest) for doc_id, digest in upserts.items()])
+        cursor.executemany(
+            'DELETE FROM sync_manifest WHERE collection = ? AND doc_id = ?',
+            [(collection, doc_id) for doc_id in deletes]
+        )
+    
+    def update_sync_manifest(self, collection: str, upserts: Dict[str, str], deletes: Sequence[str] = ()) -> bool:
+        """تسجيل المستندات التي رُفعت أو حُذفت بنجاح"""
+        try:
+            with self._connect() as conn:
+                self._update_sync_manifest(conn.cursor(), collection, upserts, deletes)
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            print(f"خطأ في تحديث سجل المزامنة: {e}")
+            return False
+    
+    def clear_sync_manifest(self, collection: Optional[str] = None) -> bool:
+        """مسح سجل المزامنة لمجموعة ونطاقاتها الفرعية "collection/..." (أو للجميع)
+        لإجبار مزامنة كاملة لاحقاً"""
+        try:
+            with self._connect() as conn:
+                if collection is None:
+                    conn.execute('DELETE FROM sync_manifest')
+                else:
+                    conn.execute('''
+                        DELETE FROM sync_manifest
+                        WHERE collection = ? OR substr(collection, 1, length(?) + 1) = ? || '/'
+                    ''', (collection, collection, collection))
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            print(f"خطأ في مسح سجل المزامنة: {e}")
+            return False
+    
+    def get_pull_cursor(self, collection: str) -> Optional[Dict]:
+        """موضع آخر سحب من مجموعة في Firebase: {'updated_at': ISO, 'ids': [...]}"""
+        with self._connect() as conn:
+            value = self._get_state(conn.cursor(), f'pull_cursor:{collection}')
+            return json.loads(value) if value else None
+    
+    def _manifest_entries(self, cursor: sqlite3.Cursor, collection: str, doc_ids: Sequence[str]) -> Dict[str, str]:
+        """بصمات مستندات محددة من سجل المزامنة"""
+        entries = {}
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), DATABASE_PAGE_SIZE):
+            chunk = doc_ids[start:start + DATABASE_PAGE_SIZE]
+            cursor.execute(f'''
+                SELECT doc_id, content_hash FROM sync_manifest
+                WHERE collection = ? AND doc_id IN ({', '.join('?' * len(chunk))})
+            ''', [collection] + chunk)
+            entries.update(cursor.fetchall())
+        return entries
+    
+    def apply_remote_teachers(self, teachers: Dict[str, Dict], hashes: Dict[str, str], pull_cursor: Dict,
+                              local_hash: Callable[[Dict], str]) -> Optional[int]:
+        """تطبيق معلمين عُدّلوا في Firebase مع حفظ موضع السحب في معاملة واحدة
+        
+        teachers و hashes حسب معرّف المستند. يُتجاهل المعلم الذي تغير صفه المحلي منذ
+        آخر رفع (بصمته المحلية local_hash تختلف عن سجل المزامنة)، فيبقى مختلفاً عن
+        السجل ويكتب الرفع التالي النسخة المحلية فوق البعيدة. بصمات المطبقين تُسجل
+        كمرفوعة. تُرجع عدد المعلمين المطبقين.
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                manifest = self._manifest_entries(cursor, 'teachers', list(teachers))
+                codes = [teacher['teacher_code'] for teacher in teachers.values()]
+                local = {}
+                for start in range(0, len(codes), DATABASE_PAGE_SIZE):
+                    chunk = codes[start:start + DATABASE_PAGE_SIZE]
+                    cursor.execute(f'''
+                        SELECT name, teacher_code, supervisor_code, subjects, classes, is_supervisor_enabled
+                        FROM teachers WHERE teacher_code IN ({', '.join('?' * len(chunk))})
+                    ''', chunk)
+                    for row in cursor.fetchall():
+                        local[row[1]] = {
+                            'name': row[0], 'teacher_code': row[1], 'supervisor_code': row[2],
+                            'subjects': json.loads(row[3]) if row[3] else [],
+                            'classes': json.loads(row[4]) if row[4] else [],
+                            'is_supervisor_enabled': bool(row[5])
+                        }
+                
+                applied = {}
+                for doc_id, teacher in teachers.items():
+                    current = local.get(teacher['teacher_code'])
+                    if manifest.get(doc_id) != (local_hash(current) if current else None):
+                        continue
+                    applied[doc_id] = teacher
+                
+                if applied:
+                    rows = [
+                        (teacher.get('name', ''), teacher['teacher_code'], teacher.get('supervisor_code') or None,
+                         json.dumps(teacher.get('subjects') or []), json.dumps(teacher.get('classes') or []),
+                         bool(teacher.get('is_supervisor_enabled', True)))
+                        for teacher in applied.values()
+                    ]
+                    cursor.executemany('''
+                        INSERT INTO teachers (name, teacher_code, supervisor_code, subjects, classes, is_supervisor_enabled)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(teacher_code) DO UPDATE SET
+                            name = excluded.name,
+                            supervisor_code = excluded.supervisor_code,
+                            subjects = excluded.subjects,
+                            classes = excluded.classes,
+                            is_supervisor_enabled = excluded.is_supervisor_enabled
+                    ''', rows)
+                    self._replace_teacher_links(cursor, [
+                        (row[1], json.loads(row[3]), json.loads(row[4])) for row in rows
+                    ])
+                    self._update_sync_manifest(cursor, 'teachers', {doc_id: hashes[doc_id] for doc_id in applied})
+                    # البيانات البعيدة محدثة أصلاً، لكن جداول المعلمين المنشورة تحتاج إعادة بناء
+                    self._enqueue_sync(cursor, 'timetables')
+                self._set_state(cursor, 'pull_cursor:teachers', json.dumps(pull_cursor))
+                conn.commit()
+                return len(applied)
+        except sqlite3.Error as e:
+            print(f"خطأ في تطبيق تغييرات المعلمين من Firebase: {e}")
+            return None
+    
+    def apply_remote_attendance(self, days: Dict[str, Dict[int, bool]], pull_cursor: Dict) -> Optional[int]:
+        """تطبيق علامات حضور عُدّلت في Firebase مع حفظ موضع السحب في معاملة واحدة
+        
+        تُتجاهل العلامة التي تغيرت محلياً منذ آخر رفع (تختلف عن سجل المزامنة)، فيرفعها
+        الرفع التالي فوق البعيدة. تُرجع عدد العلامات المطبقة.
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                applied = 0
+                for day, records in days.items():
+                    if not records:
+                        continue
+                    manifest = self._manifest_entries(
+                        cursor, f'attendance/{day}', [str(teacher_id) for teacher_id in records]
+                    )
+                    cursor.execute('SELECT teacher_id, is_present FROM attendance WHERE date = ?', (day,))
+                    local = {str(teacher_id): str(int(bool(present))) for teacher_id, present in cursor.fetchall()}
+                    records = {
+                        teacher_id: present for teacher_id, present in records.items()
+                        if manifest.get(str(teacher_id)) == local.get(str(teacher_id))
+                    }
+                    if not records:
+                        continue
+                    cursor.executemany('''
+                        INSERT INTO attendance (teacher_id, date, is_present)
+                        SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM teachers WHERE id = ?1)
+                        ON CONFLICT(teacher_id, date) DO UPDATE SET
+                            is_present = excluded.is_present
+                    ''', [(teacher_id, day, bool(present)) for teacher_id, present in records.items()])
+                    self._update_sync_manifest(cursor, f'attendance/{day}', {
+                        str(teacher_id): str(int(present)) for teacher_id, present in records.items()
+                    })
+                    applied += len(records)
+                self._set_state(cursor, 'pull_cursor:attendance', json.dumps(pull_cursor))
+                conn.commit()
+                return applied
+        except sqlite3.Error as e:
+            print(f"خطأ في تطبيق تغييرات الحضور من Firebase: {e}")
+            return None
+
     def delete_all_teachers(self) -> bool:
         """حذف جميع المعلمين من قاعدة البيانات المحلية"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT COUNT(*) FROM teachers')
                 count = cursor.fetchone()[0]
                 
+                cursor.execute('DELETE FROM teacher_subjects')
+                cursor.execute('DELETE FROM teacher_classes')
                 cursor.execute('DELETE FROM teachers')
+                cursor.execute('UPDATE schedule_entries SET teacher_id = NULL')
                 conn.commit()
                 
                 print(f"تم حذف {count} معلم من قاعدة البيانات المحلية")
@@ -161,12 +1374,15 @@ class DatabaseManager:
     def delete_all_schedules(self) -> bool:
         """حذف جميع الجداول من قاعدة البيانات المحلية"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT COUNT(*) FROM schedules')
                 count = cursor.fetchone()[0]
                 
+                cursor.execute('DELETE FROM schedule_entries')
                 cursor.execute('DELETE FROM schedules')
+                cursor.execute('DELETE FROM schedule_blobs')
+                self._set_state(cursor, 'active_schedule_id', None)
                 conn.commit()
                 
                 print(f"تم حذف {count} جدول من قاعدة البيانات المحلية")
@@ -178,7 +1394,7 @@ class DatabaseManager:
     def delete_all_attendance(self) -> bool:
         """حذف جميع بيانات الحضور من قاعدة البيانات المحلية"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT COUNT(*) FROM attendance')
                 count = cursor.fetchone()[0]
@@ -195,7 +1411,7 @@ class DatabaseManager:
     def delete_all_substitute_classes(self) -> bool:
         """حذف جميع الحصص الاحتياطية من قاعدة البيانات المحلية"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT COUNT(*) FROM substitute_classes')
                 count = cursor.fetchone()[0]
@@ -209,21 +1425,75 @@ class DatabaseManager:
             print(f"خطأ في حذف الحصص الاحتياطية من قاعدة البيانات المحلية: {e}")
             return False
     
-    def delete_all_data(self) -> bool:
-        """حذف جميع البيانات من قاعدة البيانات المحلية"""
+    # مجموعات الحذف بترتيب يحترم المفاتيح الأجنبية (الجداول التابعة أولاً)
+    PURGE_GROUPS = OrderedDict([
+        ('substitute_classes', ['substitute_classes']),
+        ('attendance', ['attendance']),
+        ('teachers', ['teacher_subjects', 'teacher_classes', 'teachers']),
+        ('schedules', ['schedule_entries', 'schedules', 'schedule_blobs']),
+    ])
+    
+    def purge(self, groups: Optional[Sequence[str]] = None, reclaim_space: bool = True) -> Optional[Dict[str, int]]:
+        """حذف مجموعات الجداول المختارة في معاملة واحدة مع فرض المفاتيح الأجنبية
+        
+        تُرجع عدد الصفوف المحذوفة لكل جدول، أو None إذا فشلت العملية ولم يُحذف شيء.
+        """
+        groups = list(groups or self.PURGE_GROUPS.keys())
+        unknown = set(groups) - set(self.PURGE_GROUPS)
+        if unknown:
+            raise ValueError(f"مجموعات غير معروفة: {', '.join(sorted(unknown))}")
+        
+        conn = self._connect()
+        counts = {}
         try:
-            success = True
-            success &= self.delete_all_substitute_classes()  # حذف الحصص الاحتياطية أولاً (foreign keys)
-            success &= self.delete_all_attendance()  # حذف الحضور ثانياً (foreign keys)
-            success &= self.delete_all_teachers()  # حذف المعلمين
-            success &= self.delete_all_schedules()  # حذف الجداول
-            
-            if success:
-                print("تم حذف جميع البيانات من قاعدة البيانات المحلية بنجاح")
+            conn.execute('PRAGMA foreign_keys=ON')
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                for group, tables in self.PURGE_GROUPS.items():
+                    if group not in groups:
+                        continue
+                    if group == 'teachers':
+                        cursor.execute('UPDATE schedule_entries SET teacher_id = NULL WHERE teacher_id IS NOT NULL')
+                    for table in tables:
+                        cursor.execute(f'DELETE FROM {table}')
+                        counts[table] = cursor.rowcount
+                    if group == 'schedules':
+                        self._set_state(cursor, 'active_schedule_id', None)
+        except sqlite3.Error as e:
+            print(f"خطأ في حذف البيانات من قاعدة البيانات المحلية: {e}")
+            return None
+        finally:
+            conn.execute('PRAGMA foreign_keys=OFF')
+        
+        if reclaim_space:
+            self.reclaim_space()
+        return counts
+    
+    def reclaim_space(self) -> bool:
+        """إرجاع الصفحات الفارغة إلى نظام الملفات وتصغير ملف قاعدة البيانات"""
+        conn = self._connect()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                conn.executescript('PRAGMA incremental_vacuum;')
             else:
-                print("حدث خطأ أثناء حذف بعض البيانات من قاعدة البيانات المحلية")
-            
-            return success
-        except Exception as e:
-            print(f"خطأ في حذف جميع البيانات من قاعدة البيانات المحلية: {e}")
-            return False
\ No newline at end of file
+                # تحويل الملف لمرة واحدة إلى الوضع التدريجي
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return True
+        except sqlite3.Error as e:
+            print(f"خطأ في ضغط قاعدة البيانات: {e}")
+            return False
+    
+    def delete_all_data(self) -> bool:
+        """حذف جميع البيانات من قاعدة البيانات المحلية"""
+        counts = self.purge()
+        if counts is None:
+            print("حدث خطأ أثناء حذف البيانات من قاعدة البيانات المحلية، ولم يُحذف أي شيء")
+            return False
+        
+        print(f"تم حذف {counts['teachers']} معلم و{counts['schedules']} جدول "
+              f"و{counts['attendance']} سجل حضور و{counts['substitute_classes']} حصة احتياطية")
+        print("تم حذف جميع البيانات من قاعدة البيانات المحلية بنجاح")
+        return True
\ No newline at end of file
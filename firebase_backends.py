@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Dict, Optional
+from config import (
+    FIREBASE_SERVICE_ACCOUNT_PATH, FIREBASE_BACKEND, FIREBASE_MEMORY_LATENCY_MS, FIREBASE_CONNECT_RETRY_SECONDS
+)
+
+
+class FirebaseBackend:
+    """واجهة مصدر عميل Firestore الذي يستخدمه FirebaseManager
+
+    العميل المُرجع من connect يجب أن يوفر collection و batch (و bulk_writer اختيارياً)
+    بنفس واجهة google.cloud.firestore. يُنشأ العميل مرة واحدة لكل مصدر في خيط
+    خلفي، فلا ينتظره إلا أول من يستخدمه فعلاً.
+    """
+
+    name = ''
+    # قيمة "وقت الخادم" الخاصة بهذا المصدر
+    SERVER_TIMESTAMP = None
+
+    def __init__(self):
+        self._client = None
+        self.error: Optional[str] = None
+        self._failed_at = 0.0
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def status(self) -> str:
+        """idle أو connecting أو ready أو failed"""
+        if self._ready.is_set():
+            return 'ready' if self._client is not None else 'failed'
+        return 'idle' if self._thread is None else 'connecting'
+
+    def start(self):
+        """بدء الاتصال في الخلفية (مرة واحدة، أو من جديد بعد فشل مضى عليه وقت كافٍ)"""
+        with self._lock:
+            if self._thread is not None:
+                retry_due = time.time() - self._failed_at >= FIREBASE_CONNECT_RETRY_SECONDS
+                if self.status != 'failed' or not retry_due:
+                    return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._connect_in_background, name="firebase-connect", daemon=True)
+            self._thread.start()
+
+    def _connect_in_background(self):
+        try:
+            self._client = self.connect()
+            self.error = None
+            print(f"تم الاتصال بـ Firebase بنجاح ({self.name})")
+        except Exception as e:
+            self.error = str(e)
+            self._failed_at = time.time()
+            print(f"خطأ في الاتصال بـ Firebase: {e}")
+        finally:
+            self._ready.set()
+
+    def get_client(self, timeout: Optional[float] = None):
+        """العميل المشترك بعد اكتمال الاتصال (ينتظر حتى timeout)، أو None"""
+        self.start()
+        self._ready.wait(timeout)
+        return self._client
+
+    def connect(self):
+        raise NotImplementedError
+
+    def bulk_writer(self, client, max_ops_per_second: int):
+        """كاتب جماعي للعميل، أو None إن لم يكن مدعوماً"""
+        return None
+
+
+class FirestoreBackend(FirebaseBackend):
+    """Firestore الحقيقي عبر firebase_admin وملف حساب الخدمة"""
+
+    name = 'firestore'
+
+    def __init__(self, service_account_path: str = FIREBASE_SERVICE_ACCOUNT_PATH):
+        super().__init__()
+        self.service_account_path = service_account_path
+
+    def connect(self):
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(self.service_account_path)
+            firebase_admin.initialize_app(cred)
+
+        self.SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
+        return firestore.client()
+
+    def bulk_writer(self, client, max_ops_per_second: int):
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+        return client.bulk_writer(options=BulkWriterOptions(max_ops_per_second=max_ops_per_second))
+
+
+class MemoryBackend(FirebaseBackend):
+    """Firestore داخل الذاكرة للعمل دون اتصال ولقياس المزامنة
+
+    يحتفظ المصدر بعميل واحد، فتبقى البيانات بين نسخ FirebaseManager في نفس العملية.
+    """
+
+    name = 'memory'
+
+    def __init__(self, latency_ms: float = FIREBASE_MEMORY_LATENCY_MS, jitter_ms: float = 0.0,
+                 seed: Optional[int] = None):
+        from memory_firestore import MemoryFirestore, SERVER_TIMESTAMP
+
+        super().__init__()
+        self.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+        self.client = MemoryFirestore(latency=latency_ms / 1000.0, jitter=jitter_ms / 1000.0, seed=seed)
+
+    def connect(self):
+        return self.client
+
+    def bulk_writer(self, client, max_ops_per_second: int):
+        return client.bulk_writer()
+
+
+BACKENDS = {
+    FirestoreBackend.name: FirestoreBackend,
+    MemoryBackend.name: MemoryBackend,
+}
+
+_shared: Dict[str, FirebaseBackend] = {}
+_shared_lock = threading.Lock()
+
+
+def get_backend(name: Optional[str] = None) -> FirebaseBackend:
+    """المصدر المشترك للعملية حسب الاسم (الافتراضي من FIREBASE_BACKEND)"""
+    name = name or FIREBASE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"مصدر Firebase غير معروف: {name}")
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = BACKENDS[name]()
+        return _shared[name]
@@ -1,41 +1,154 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import hashlib
 import json
-from config import FIREBASE_SERVICE_ACCOUNT_PATH
+import threading
+from datetime import date
+from database import DatabaseManager
+from firestore_cache import FirestoreCache
+from firebase_backends import FirebaseBackend, get_backend
+from config import (
+    FIRESTORE_BATCH_LIMIT, FIRESTORE_SHARD_BATCH_SIZE, FIRESTORE_WRITE_WORKERS,
+    FIRESTORE_DELETE_PAGE_SIZE, FIRESTORE_DELETE_WORKERS, FIRESTORE_BULK_MAX_OPS_PER_SECOND,
+    FIRESTORE_COUNT_TTL_SECONDS, FIREBASE_CONNECT_TIMEOUT
+)
 
 class FirebaseManager:
-    def __init__(self):
-        self.db = None
+    # الحقول المرفوعة لكل معلم (بدون المعرّف المحلي وتاريخ الإنشاء)
+    TEACHER_FIELDS = ('name', 'teacher_code', 'supervisor_code', 'subjects', 'classes', 'is_supervisor_enabled')
+    # الحقول المرفوعة لكل حصة احتياطية (بدون معرّف الصف المحلي)
+    SUBSTITUTE_FIELDS = ('original_teacher_id', 'substitute_teacher_id', 'class_name', 'period', 'date', 'week_number')
+    # مستند الجدول الحالي (الفهرس) ومجموعة مستندات الفصول تحته
+    SCHEDULE_PATH = 'schedules/current'
+    SCHEDULE_CLASSES_PATH = 'schedules/current/classes'
+    # جدول كل معلم جاهزاً لتطبيق الجوال (مستند لكل teacher_code)
+    TIMETABLES_PATH = 'teacher_timetables'
+    
+    def __init__(self, local_db=None, backend: Optional[FirebaseBackend] = None):
+        # مصدر العميل: Firestore الحقيقي أو بديل الذاكرة (FIREBASE_BACKEND)، مشترك للعملية
+        self.backend = backend or get_backend()
+        # قاعدة البيانات المحلية تحفظ بصمات المستندات المرفوعة لتجنب إعادة رفعها
+        self.local_db = local_db
+        # ذاكرة القراءة مشتركة بين النسخ حتى تبقى المستمعات والقيم بين إعادات التشغيل
+        self.cache = FirestoreCache.shared()
         self.init_firebase()
     
     def init_firebase(self):
-        """تهيئة Firebase"""
-        try:
-            if not firebase_admin._apps:
-                cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_PATH)
-                firebase_admin.initialize_app(cred)
-            
-            self.db = firestore.client()
-            print("تم الاتصال بـ Firebase بنجاح")
-        except Exception as e:
-            print(f"خطأ في الاتصال بـ Firebase: {e}")
+        """بدء تهيئة Firebase في الخلفية (لا ينتظر اكتمالها)"""
+        self.backend.start()
+    
+    @property
+    def db(self):
+        """عميل Firestore المشترك؛ أول استخدام ينتظر اكتمال الاتصال (None عند الفشل)"""
+        return self.backend.get_client(timeout=FIREBASE_CONNECT_TIMEOUT)
+    
+    @property
+    def is_ready(self) -> bool:
+        """هل اكتمل الاتصال بـ Firebase (بدون انتظار)"""
+        return self.backend.status == 'ready'
+    
+    def _commit_batched(self, operations: List[tuple], on_commit: Optional[Callable[[List[tuple]], None]] = None,
+                        batch_size: int = FIRESTORE_BATCH_LIMIT, workers: int = 1) -> int:
+        """تنفيذ عمليات ('set', ref, data) أو ('delete', ref) في دفعات ذرية
+        
+        كل دفعة لا تتجاوز batch_size (وحد Firestore 500 عملية) وتُنفذ كوحدة واحدة،
+        وتُرسل حتى workers دفعات في نفس الوقت. تُرجع عدد العمليات المنفذة،
+        وترفع الاستثناء عند فشل أي دفعة.
+        """
+        def commit(chunk):
+            batch = self.db.batch()
+            for operation in chunk:
+                if operation[0] == 'set':
+                    batch.set(operation[1], operation[2])
+                else:
+                    batch.delete(operation[1])
+            batch.commit()
+            if on_commit:
+                on_commit(chunk)
+            return len(chunk)
+        
+        batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        chunks = [operations[start:start + batch_size] for start in range(0, len(operations), batch_size)]
+        if workers <= 1 or len(chunks) <= 1:
+            return sum(commit(chunk) for chunk in chunks)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(commit, chunks))
+    
+    @staticmethod
+    def _content_hash(document: Dict) -> str:
+        """بصمة ثابتة لمحتوى مستند"""
+        return hashlib.sha256(
+            json.dumps(document, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+        ).hexdigest()
+    
+    @staticmethod
+    def _doc_id(value) -> str:
+        """معرّف مستند صالح في Firestore (بدون /)"""
+        return str(value).strip().replace('/', '_')
     
-    def sync_teachers(self, teachers_data: List[Dict]) -> bool:
-        """مزامنة بيانات المعلمين مع Firebase"""
+    def _teacher_document(self, teacher: Dict) -> Dict:
+        """مستند المعلم كما يُرفع إلى Firebase"""
+        document = {field: teacher.get(field) for field in self.TEACHER_FIELDS}
+        document['subjects'] = document['subjects'] or []
+        document['classes'] = document['classes'] or []
+        document['is_supervisor_enabled'] = bool(teacher.get('is_supervisor_enabled', True))
+        return document
+    
+    def _sync_documents(self, collection: str, documents: Dict[str, Dict], force_full: bool = False,
+                        batch_size: int = FIRESTORE_BATCH_LIMIT, workers: int = 1,
+                        before_deletes: Optional[Callable[[], None]] = None,
+                        scope: Optional[Tuple[str, Any]] = None) -> Dict[str, int]:
+        """رفع المستندات المتغيرة فقط وحذف غير الموجودة، حسب سجل البصمات المحلي
+        
+        عند غياب السجل (أول مزامنة أو بدون قاعدة محلية) تُقرأ مفاتيح المجموعة فقط للمقارنة.
+        scope=(field, value) يقصر المقارنة والحذف على المستندات التي يساوي فيها field القيمة value.
+        يُستدعى before_deletes بعد نجاح كل الكتابات وقبل الحذف.
+        """
+        collection_ref = self.db.collection(collection)
+        hashes = {doc_id: self._content_hash(document) for doc_id, document in documents.items()}
+        
+        manifest_key = collection if scope is None else f"{collection}/{scope[0]}={scope[1]}"
+        manifest = self.local_db.get_sync_manifest(manifest_key) if self.local_db else {}
+        if force_full or not manifest:
+            listing = collection_ref if scope is None else collection_ref.where(scope[0], '==', scope[1])
+            manifest = {doc.id: None for doc in listing.select([]).stream()}
+        
+        # updated_at خارج البصمة، ويسمح للسحب من Firebase بقراءة ما تغير فقط
+        writes = [
+            ('set', collection_ref.document(doc_id), dict(documents[doc_id], updated_at=self.backend.SERVER_TIMESTAMP))
+            for doc_id in documents if manifest.get(doc_id) != hashes[doc_id]
+        ]
+        deletes = [('delete', collection_ref.document(doc_id)) for doc_id in manifest if doc_id not in documents]
+        
+        def record(chunk):
+            if self.local_db:
+                self.local_db.update_sync_manifest(
+                    manifest_key,
+                    {op[1].id: hashes[op[1].id] for op in chunk if op[0] == 'set'},
+                    [op[1].id for op in chunk if op[0] == 'delete']
+                )
+        
+        # الكتابة قبل الحذف حتى لا تبقى المجموعة فارغة عند أي فشل
+        self._commit_batched(writes, on_commit=record, batch_size=batch_size, workers=workers)
+        if before_deletes:
+            before_deletes()
+        self._commit_batched(deletes, on_commit=record)
+        return {'written': len(writes), 'deleted': len(deletes), 'unchanged': len(documents) - len(writes)}
+    
+    def sync_teachers(self, teachers_data: List[Dict], force_full: bool = False) -> bool:
+        """مزامنة بيانات المعلمين مع Firebase (مستند لكل teacher_code)"""
         try:
             if not self.db:
                 return False
             
-            # حذف البيانات القديمة
-            teachers_ref = self.db.collection('teachers')
-            docs = teachers_ref.stream()
-            for doc in docs:
-                doc.reference.delete()
-            
-            # إضافة البيانات الجديدة
+            documents = {}
             for teacher in teachers_data:
-                teachers_ref.add(teacher)
+                if teacher.get('teacher_code'):
+                    documents[self._doc_id(teacher['teacher_code'])] = self._teacher_document(teacher)
+            
+            result = self._sync_documents('teachers', documents, force_full)
+            self.cache.invalidate('teachers')
+            print(f"مزامنة المعلمين: {result['written']} مكتوب، {result['deleted']} محذوف، {result['unchanged']} بدون تغيير")
             
             return True
         except Exception as e:
@@ -43,97 +156,342 @@ class FirebaseManager:
             return False
     
     def sync_schedule(self, schedule_data: Dict) -> bool:
-        """مزامنة الجدول المدرسي مع Firebase"""
+        """مزامنة الجدول المدرسي مع Firebase (مستند لكل فصل تحت schedules/current)
+        
+        تُرفع مستندات الفصول المتغيرة فقط وبالتوازي، ثم مستند الفهرس الذي يحمل
+        رقم النسخة وبصمة كل فصل، ثم تُحذف الفصول التي لم تعد موجودة.
+        """
         try:
             if not self.db:
                 return False
             
-            # حفظ الجدول
-            schedule_ref = self.db.collection('schedules').document('current')
-            schedule_ref.set({
-                'data': schedule_data,
-                'last_updated': firestore.SERVER_TIMESTAMP,
+            schedule = schedule_data.get('schedule') or {}
+            classes = schedule.get('classes') or {}
+            documents = {
+                self._doc_id(class_name): {'class_name': class_name, 'days': days}
+                for class_name, days in classes.items()
+            }
+            
+            meta = {key: value for key, value in schedule_data.items() if key != 'schedule'}
+            meta['schedule'] = {key: value for key, value in schedule.items() if key != 'classes'}
+            manifest = {
+                'version': self._content_hash(schedule_data),
+                'class_order': list(documents.keys()),
+                'classes': {doc_id: self._content_hash(document) for doc_id, document in documents.items()},
+                'meta': meta,
+                'last_updated': self.backend.SERVER_TIMESTAMP,
                 'is_active': True
-            })
+            }
+            
+            def publish_manifest():
+                self.db.document(self.SCHEDULE_PATH).set(manifest)
+            
+            result = self._sync_documents(
+                self.SCHEDULE_CLASSES_PATH, documents,
+                batch_size=FIRESTORE_SHARD_BATCH_SIZE, workers=FIRESTORE_WRITE_WORKERS,
+                before_deletes=publish_manifest
+            )
+            self.cache.invalidate('schedules')
+            print(f"مزامنة الجدول: {result['written']} فصل مكتوب، {result['deleted']} محذوف، {result['unchanged']} بدون تغيير")
             
             return True
         except Exception as e:
             print(f"خطأ في مزامنة الجدول: {e}")
             return False
     
-    def update_attendance(self, attendance_data: Dict) -> bool:
-        """تحديث بيانات الحضور والغياب"""
+    def _teacher_timetables(self, teachers: List[Dict], entries: List[Dict],
+                            substitutes: List[Dict]) -> Dict[str, Dict]:
+        """بناء مستند جدول لكل معلم: حصصه وفصوله ومواده وحصص الاحتياط المكلف بها"""
+        documents = {}
+        by_name = {}
+        by_id = {}
+        for teacher in teachers:
+            if not teacher.get('teacher_code'):
+                continue
+            document = {
+                'teacher_code': teacher['teacher_code'],
+                'name': teacher['name'],
+                'slots': [],
+                'classes': [],
+                'subjects': [],
+                'substitute_duties': []
+            }
+            documents[self._doc_id(teacher['teacher_code'])] = document
+            by_name[teacher['name']] = document
+            by_id[teacher['id']] = document
+        
+        day_order = {}
+        for entry in entries:
+            day_order.setdefault(entry['day'], len(day_order))
+        for entry in sorted(entries, key=lambda item: (day_order[item['day']], item['period_index'])):
+            document = by_name.get(entry['teacher'])
+            if document is None:
+                continue
+            document['slots'].append({
+                'day': entry['day'],
+                'period': entry['period'],
+                'class_name': entry['class_name'],
+                'subject': entry['subject']
+            })
+        
+        for substitute in substitutes:
+            document = by_id.get(substitute['substitute_teacher_id'])
+            if document is None:
+                continue
+            original = by_id.get(substitute['original_teacher_id'])
+            document['substitute_duties'].append({
+                'date': substitute['date'],
+                'period': substitute['period'],
+                'class_name': substitute['class_name'],
+                'original_teacher_code': original['teacher_code'] if original else None,
+                'original_teacher_name': original['name'] if original else None
+            })
+        
+        for document in documents.values():
+            document['classes'] = sorted({slot['class_name'] for slot in document['slots']})
+            document['subjects'] = sorted({slot['subject'] for slot in document['slots'] if slot['subject']})
+        return documents
+    
+    def sync_teacher_timetables(self, teachers: List[Dict], entries: List[Dict], substitutes: List[Dict]) -> bool:
+        """نشر جدول كل معلم في teacher_timetables/{teacher_code}
+        
+        يُعاد بناء كل المستندات محلياً، ولا يُرفع منها إلا ما تغيرت بصمته.
+        """
         try:
             if not self.db:
                 return False
             
-            date_str = attendance_data.get('date', '')
-            attendance_ref = self.db.collection('attendance').document(date_str)
-            attendance_ref.set(attendance_data)
+            documents = self._teacher_timetables(teachers, entries, substitutes)
+            result = self._sync_documents(self.TIMETABLES_PATH, documents)
+            self.cache.invalidate(self.TIMETABLES_PATH)
+            print(f"مزامنة جداول المعلمين: {result['written']} مكتوب، {result['deleted']} محذوف، {result['unchanged']} بدون تغيير")
             
             return True
         except Exception as e:
-            print(f"خطأ في تحديث الحضور: {e}")
+            print(f"خطأ في مزامنة جداول المعلمين: {e}")
             return False
     
-    def update_substitute_classes(self, substitute_data: List[Dict]) -> bool:
-        """تحديث بيانات الحصص الاحتياطية"""
+    def update_attendance(self, attendance_date: str, records: Dict[int, bool]) -> bool:
+        """رفع علامات الحضور المتغيرة فقط إلى attendance/{date}
+        
+        تُكتب العلامات بدمج الحقول (merge=True) في خريطة records، فتسجيل غياب
+        معلم واحد لا يعيد كتابة سجل اليوم كله.
+        """
         try:
             if not self.db:
                 return False
             
-            # حذف البيانات القديمة لهذا الأسبوع
-            week_number = substitute_data[0].get('week_number') if substitute_data else 0
+            manifest_key = f"attendance/{attendance_date}"
+            marks = {str(teacher_id): bool(present) for teacher_id, present in records.items()}
+            manifest = self.local_db.get_sync_manifest(manifest_key) if self.local_db else {}
+            changed = {teacher_id: present for teacher_id, present in marks.items()
+                       if manifest.get(teacher_id) != str(int(present))}
+            if not changed:
+                return True
+            
+            self.db.collection('attendance').document(self._doc_id(attendance_date)).set({
+                'date': attendance_date,
+                'records': changed,
+                'updated_at': self.backend.SERVER_TIMESTAMP
+            }, merge=True)
+            if self.local_db:
+                self.local_db.update_sync_manifest(
+                    manifest_key, {teacher_id: str(int(present)) for teacher_id, present in changed.items()}
+                )
+            self.cache.invalidate('attendance')
             
-            substitutes_ref = self.db.collection('substitute_classes')
-            old_docs = substitutes_ref.where('week_number', '==', week_number).stream()
-            for doc in old_docs:
-                doc.reference.delete()
+            return True
+        except Exception as e:
+            print(f"خطأ في تحديث الحضور: {e}")
+            return False
+    
+    def _substitute_doc_id(self, substitute: Dict) -> str:
+        """معرّف ثابت لحصة احتياطية: التاريخ + المعلم الغائب + الحصة"""
+        return self._doc_id(f"{substitute.get('date')}_{substitute.get('original_teacher_id')}_{substitute.get('period')}")
+    
+    def update_substitute_classes(self, substitute_data: List[Dict], week_start: Optional[date] = None) -> bool:
+        """مزامنة الحصص الاحتياطية أسبوعاً أسبوعاً بمعرّفات ثابتة
+        
+        كل أسبوع يُعرّف بتاريخ بدايته (حقل week_start في المستند) لا برقمه الذي
+        يتكرر كل سنة. لا يُكتب إلا ما تغير، وتُحذف حصص الأسبوع التي لم تعد موجودة.
+        عند تمرير week_start تُزامن حصص ذلك الأسبوع فقط (وقائمة فارغة تحذفها كلها).
+        """
+        try:
+            if not self.db:
+                return False
             
-            # إضافة البيانات الجديدة
+            by_week = {}
             for substitute in substitute_data:
-                substitutes_ref.add(substitute)
+                start = DatabaseManager.week_start(date.fromisoformat(substitute['date'])).isoformat()
+                by_week.setdefault(start, []).append(substitute)
+            if week_start is not None:
+                by_week = {week_start.isoformat(): by_week.get(week_start.isoformat(), [])}
+            
+            for week, substitutes in by_week.items():
+                documents = {
+                    self._substitute_doc_id(substitute): dict(
+                        {field: substitute.get(field) for field in self.SUBSTITUTE_FIELDS}, week_start=week
+                    )
+                    for substitute in substitutes
+                }
+                result = self._sync_documents('substitute_classes', documents, scope=('week_start', week))
+                print(f"مزامنة حصص الأسبوع {week}: {result['written']} مكتوب، {result['deleted']} محذوف، {result['unchanged']} بدون تغيير")
+            self.cache.invalidate('substitute_classes')
             
             return True
         except Exception as e:
             print(f"خطأ في تحديث الحصص الاحتياطية: {e}")
             return False
     
+    @staticmethod
+    def _teachers_from_snapshots(snapshots) -> List[Dict]:
+        teachers = []
+        for doc in snapshots:
+            teacher_data = doc.to_dict()
+            teacher_data['id'] = doc.id
+            teachers.append(teacher_data)
+        return teachers
+    
+    def _assemble_schedule(self, snapshots) -> Optional[Dict]:
+        """إعادة بناء الجدول الكامل من مستند الفهرس ومستندات الفصول"""
+        manifest = next((doc.to_dict() for doc in snapshots if doc.exists), None)
+        if not manifest:
+            return None
+        if 'data' in manifest:
+            # جدول مرفوع بالصيغة القديمة (مستند واحد)
+            return manifest['data']
+        
+        class_docs = {doc.id: doc.to_dict() for doc in self.db.collection(self.SCHEDULE_CLASSES_PATH).stream()}
+        classes = {}
+        for doc_id in manifest.get('class_order', []):
+            if doc_id in class_docs:
+                classes[class_docs[doc_id]['class_name']] = class_docs[doc_id]['days']
+        
+        schedule_data = dict(manifest.get('meta') or {})
+        schedule_data['schedule'] = dict(schedule_data.get('schedule') or {}, classes=classes)
+        return schedule_data
+    
     def get_teachers(self) -> List[Dict]:
-        """الحصول على بيانات المعلمين من Firebase"""
+        """الحصول على بيانات المعلمين من Firebase (من الذاكرة ما دامت حديثة)"""
         try:
             if not self.db:
                 return []
             
             teachers_ref = self.db.collection('teachers')
-            docs = teachers_ref.stream()
-            
-            teachers = []
-            for doc in docs:
-                teacher_data = doc.to_dict()
-                teacher_data['id'] = doc.id
-                teachers.append(teacher_data)
-            
-            return teachers
+            self.cache.watch('teachers', teachers_ref, self._teachers_from_snapshots)
+            return list(self.cache.get('teachers', lambda: self._teachers_from_snapshots(teachers_ref.stream())))
         except Exception as e:
             print(f"خطأ في جلب بيانات المعلمين: {e}")
             return []
     
     def get_current_schedule(self) -> Optional[Dict]:
-        """الحصول على الجدول الحالي من Firebase"""
+        """الحصول على الجدول الحالي من Firebase (من الذاكرة ما دامت حديثة)"""
+        try:
+            if not self.db:
+                return None
+            
+            schedule_ref = self.db.document(self.SCHEDULE_PATH)
+            self.cache.watch(self.SCHEDULE_PATH, schedule_ref, self._assemble_schedule)
+            return self.cache.get(self.SCHEDULE_PATH, lambda: self._assemble_schedule([schedule_ref.get()]))
+        except Exception as e:
+            print(f"خطأ في جلب الجدول: {e}")
+            return None
+    
+    def count_documents(self, collection: str) -> Optional[int]:
+        """عدد مستندات مجموعة بتجميع count() على الخادم (محفوظ لفترة قصيرة)
+        
+        يُرجع None عند عدم الاتصال أو الفشل.
+        """
         try:
             if not self.db:
                 return None
             
-            schedule_ref = self.db.collection('schedules').document('current')
-            doc = schedule_ref.get()
+            query = self.db.collection(collection)
+            
+            def load():
+                if hasattr(query, 'count'):
+                    return query.count(alias='all').get()[0][0].value
+                # عملاء قدامى بدون تجميع: قراءة المفاتيح فقط
+                return sum(1 for _ in query.select([]).stream())
             
-            if doc.exists:
-                return doc.to_dict().get('data')
+            return self.cache.get(f"{collection}#count", load, ttl=FIRESTORE_COUNT_TTL_SECONDS)
+        except Exception as e:
+            print(f"خطأ في عدّ مستندات {collection}: {e}")
             return None
+    
+    def document_exists(self, path: str) -> bool:
+        """هل المستند موجود (بدون تنزيل محتواه)"""
+        try:
+            if not self.db:
+                return False
+            
+            document_ref = self.db.document(path)
+            return self.cache.get(
+                f"{path}#exists",
+                lambda: document_ref.get(field_paths=['is_active']).exists,
+                ttl=FIRESTORE_COUNT_TTL_SECONDS
+            )
         except Exception as e:
-            print(f"خطأ في جلب الجدول: {e}")
+            print(f"خطأ في فحص المستند {path}: {e}")
+            return False
+    
+    def count_teachers(self) -> Optional[int]:
+        """عدد المعلمين في Firebase"""
+        return self.count_documents('teachers')
+    
+    def has_current_schedule(self) -> bool:
+        """هل يوجد جدول حالي في Firebase"""
+        return self.document_exists(self.SCHEDULE_PATH)
+    
+    def watch_class_schedule(self, class_name: str, callback: Callable[[Optional[Dict]], None]):
+        """الاستماع لجدول فصل واحد فقط؛ يُستدعى callback بأيام الفصل أو None عند حذفه
+        
+        تُرجع كائن المستمع (unsubscribe لإيقافه) أو None عند عدم الاتصال.
+        """
+        if not self.db:
             return None
+        
+        def on_snapshot(snapshots, changes, read_time):
+            document = next((doc.to_dict() for doc in snapshots if doc.exists), None)
+            callback(document['days'] if document else None)
+        
+        class_ref = self.db.collection(self.SCHEDULE_CLASSES_PATH).document(self._doc_id(class_name))
+        return class_ref.on_snapshot(on_snapshot)
+    
+    def _delete_collection(self, name: str, progress: Optional[Callable[[int], None]] = None) -> int:
+        """حذف كل مستندات مجموعة على صفحات بمفاتيح فقط عبر BulkWriter
+        
+        يُستدعى progress بعدد المستندات المحذوفة حتى الآن بعد كل صفحة.
+        """
+        collection_ref = self.db.collection(name)
+        writer = self.backend.bulk_writer(self.db, FIRESTORE_BULK_MAX_OPS_PER_SECOND)
+        
+        deleted = 0
+        last_doc = None
+        try:
+            while True:
+                query = collection_ref.select([]).limit(FIRESTORE_DELETE_PAGE_SIZE)
+                if last_doc is not None:
+                    query = query.start_after(last_doc)
+                docs = list(query.stream())
+                if not docs:
+                    break
+                
+                if writer is not None:
+                    for doc in docs:
+                        writer.delete(doc.reference)
+                    writer.flush()
+                else:
+                    self._commit_batched([('delete', doc.reference) for doc in docs])
+                
+                deleted += len(docs)
+                last_doc = docs[-1]
+                if progress:
+                    progress(deleted)
+        finally:
+            if writer is not None:
+                writer.close()
+        return deleted
     
     def delete_all_teachers(self) -> bool:
         """حذف جميع بيانات المعلمين من Firebase"""
@@ -141,13 +499,14 @@ class FirebaseManager:
             if not self.db:
                 return False
             
-            teachers_ref = self.db.collection('teachers')
-            docs = teachers_ref.stream()
+            deleted_count = self._delete_collection('teachers')
+            self._delete_collection(self.TIMETABLES_PATH)
+            self.cache.invalidate('teachers')
+            self.cache.invalidate(self.TIMETABLES_PATH)
             
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
+            if self.local_db:
+                self.local_db.clear_sync_manifest('teachers')
+                self.local_db.clear_sync_manifest(self.TIMETABLES_PATH)
             
             print(f"تم حذف {deleted_count} معلم من Firebase")
             return True
@@ -161,13 +520,11 @@ class FirebaseManager:
             if not self.db:
                 return False
             
-            schedules_ref = self.db.collection('schedules')
-            docs = schedules_ref.stream()
-            
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
+            deleted_count = self._delete_collection(self.SCHEDULE_CLASSES_PATH)
+            deleted_count += self._delete_collection('schedules')
+            self.cache.invalidate('schedules')
+            if self.local_db:
+                self.local_db.clear_sync_manifest(self.SCHEDULE_CLASSES_PATH)
             
             print(f"تم حذف {deleted_count} جدول من Firebase")
             return True
@@ -181,13 +538,10 @@ class FirebaseManager:
             if not self.db:
                 return False
             
-            attendance_ref = self.db.collection('attendance')
-            docs = attendance_ref.stream()
-            
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
+            deleted_count = self._delete_collection('attendance')
+            self.cache.invalidate('attendance')
+            if self.local_db:
+                self.local_db.clear_sync_manifest('attendance')
             
             print(f"تم حذف {deleted_count} سجل حضور من Firebase")
             return True
@@ -201,13 +555,10 @@ class FirebaseManager:
             if not self.db:
                 return False
             
-            substitutes_ref = self.db.collection('substitute_classes')
-            docs = substitutes_ref.stream()
-            
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
+            deleted_count = self._delete_collection('substitute_classes')
+            self.cache.invalidate('substitute_classes')
+            if self.local_db:
+                self.local_db.clear_sync_manifest('substitute_classes')
             
             print(f"تم حذف {deleted_count} حصة احتياطية من Firebase")
             return True
@@ -215,17 +566,50 @@ class FirebaseManager:
             print(f"خطأ في حذف الحصص الاحتياطية: {e}")
             return False
     
-    def delete_all_data(self) -> bool:
-        """حذف جميع البيانات من Firebase"""
+    def delete_all_data(self, progress: Optional[Callable[[Dict[str, int]], None]] = None) -> bool:
+        """حذف جميع البيانات من Firebase (كل المجموعات بالتوازي)
+        
+        يُستدعى progress من الخيط المستدعي بعدد المحذوف لكل مجموعة حتى الآن.
+        """
         try:
+            if not self.db:
+                return False
+            
+            collections = [
+                'teachers', self.TIMETABLES_PATH, 'schedules', self.SCHEDULE_CLASSES_PATH,
+                'attendance', 'substitute_classes'
+            ]
+            counts = {name: 0 for name in collections}
+            lock = threading.Lock()
+            
+            def report(name):
+                def update(deleted):
+                    with lock:
+                        counts[name] = deleted
+                return update
+            
+            with ThreadPoolExecutor(max_workers=FIRESTORE_DELETE_WORKERS) as executor:
+                futures = {executor.submit(self._delete_collection, name, report(name)): name for name in collections}
+                pending = set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=0.5)
+                    if progress:
+                        with lock:
+                            progress(dict(counts))
+            
             success = True
-            success &= self.delete_all_teachers()
-            success &= self.delete_all_schedules()
-            success &= self.delete_all_attendance()
-            success &= self.delete_all_substitute_classes()
+            for future, name in futures.items():
+                error = future.exception()
+                if error:
+                    print(f"خطأ في حذف {name} من Firebase: {error}")
+                    success = False
+            
+            self.cache.invalidate()
+            if self.local_db:
+                self.local_db.clear_sync_manifest()
             
             if success:
-                print("تم حذف جميع البيانات من Firebase بنجاح")
+                print(f"تم حذف جميع البيانات من Firebase بنجاح: {counts}")
             else:
                 print("حدث خطأ أثناء حذف بعض البيانات")
             
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from config import FIRESTORE_CACHE_TTL_SECONDS, FIRESTORE_CACHE_PATH
+
+
+class FirestoreCache:
+    """ذاكرة قراءة لمستندات ومجموعات Firestore مشتركة بين كل نسخ FirebaseManager
+
+    تُحدَّث المفاتيح المراقبة من مستمعات on_snapshot فلا تحتاج لإعادة القراءة،
+    وغير المراقبة (أو التي تعطل مستمعها) تنتهي صلاحيتها بعد TTL.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl: float = FIRESTORE_CACHE_TTL_SECONDS, path: Optional[str] = FIRESTORE_CACHE_PATH):
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        # المفتاح -> {'value', 'loaded_at', 'live'}
+        self._entries: Dict[str, Dict] = {}
+        self._watches: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load_disk()
+
+    @classmethod
+    def shared(cls) -> 'FirestoreCache':
+        """الذاكرة المشتركة للعملية (تبقى بين إعادات تشغيل الصفحة)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """إرجاع القيمة المحفوظة إن كانت حديثة، وإلا قراءتها بـ loader وحفظها"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (entry['live'] or time.time() - entry['loaded_at'] < ttl):
+                self.hits += 1
+                return entry['value']
+            self.misses += 1
+
+        value = loader()
+        self._store(key, value, live=False)
+        return value
+
+    def watch(self, key: str, query, transform: Callable[[list], Any]):
+        """ربط المفتاح بمستمع on_snapshot على مستند أو مجموعة (مرة واحدة لكل مفتاح)
+
+        transform يحوّل قائمة اللقطات إلى القيمة المحفوظة.
+        """
+        with self._lock:
+            if key in self._watches:
+                return
+
+            def on_snapshot(snapshots, changes, read_time):
+                try:
+                    self._store(key, transform(snapshots), live=True)
+                except Exception as e:
+                    print(f"خطأ في تحديث الذاكرة من Firebase ({key}): {e}")
+                    self._mark_stale(key)
+
+            try:
+                self._watches[key] = query.on_snapshot(on_snapshot)
+            except Exception as e:
+                print(f"تعذر الاستماع لتغييرات {key}: {e}")
+
+    def invalidate(self, prefix: Optional[str] = None):
+        """إسقاط المفاتيح (أو التي تبدأ بـ prefix) بعد كتابة محلية
+
+        تبقى المستمعات تعمل، فتعود القيمة حية مع أول لقطة بعد الكتابة.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if prefix is None or key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+        self._save_disk()
+
+    def close(self):
+        """إيقاف كل المستمعات"""
+        with self._lock:
+            for watch in self._watches.values():
+                self._unsubscribe(watch)
+            self._watches.clear()
+            for entry in self._entries.values():
+                entry['live'] = False
+
+    def _store(self, key: str, value: Any, live: bool):
+        with self._lock:
+            self._entries[key] = {'value': value, 'loaded_at': time.time(), 'live': live}
+        self._save_disk()
+
+    def _mark_stale(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry['live'] = False
+
+    @staticmethod
+    def _unsubscribe(watch):
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            print(f"خطأ في إيقاف مستمع Firebase: {e}")
+
+    def _load_disk(self):
+        """تحميل آخر قيم معروفة من القرص (تُعامل كغير مراقبة حتى انتهاء TTL)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for key, entry in json.load(f).items():
+                    self._entries[key] = {'value': entry['value'], 'loaded_at': entry['loaded_at'], 'live': False}
+        except Exception as e:
+            print(f"خطأ في قراءة ذاكرة Firebase من القرص: {e}")
+
+    def _save_disk(self):
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                data = {
+                    key: {'value': entry['value'], 'loaded_at': entry['loaded_at']}
+                    for key, entry in self._entries.items()
+                }
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"خطأ في حفظ ذاكرة Firebase على القرص: {e}")
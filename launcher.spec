@@ -11,7 +11,16 @@ a = Analysis(
         ('config.py', '.'),
         ('database.py', '.'),
         ('ai_processor.py', '.'),
+        ('ai_cache.py', '.'),
+        ('timetable_parser.py', '.'),
         ('firebase_manager.py', '.'),
+        ('firebase_backends.py', '.'),
+        ('memory_firestore.py', '.'),
+        ('firestore_cache.py', '.'),
+        ('schedule_versions.py', '.'),
+        ('substitute_engine.py', '.'),
+        ('sync_worker.py', '.'),
+        ('pull_sync.py', '.'),
         ('.streamlit', '.streamlit'),
     ],
     hiddenimports=[
@@ -7,6 +7,8 @@ import plotly.graph_objects as go
 from database import DatabaseManager
 from ai_processor import AIProcessor
 from firebase_manager import FirebaseManager
+from substitute_engine import SubstituteEngine
+from sync_worker import SyncWorker
 from config import APP_TITLE, APP_ICON
 
 # إعداد الصفحة
@@ -21,12 +23,19 @@ st.set_page_config(
 def init_components():
     db = DatabaseManager()
     ai = AIProcessor()
-    firebase = FirebaseManager()
+    firebase = FirebaseManager(db)
     return db, ai, firebase
 
 # إعادة تهيئة المكونات في كل مرة لتجنب مشاكل التخزين المؤقت
 db, ai, firebase = init_components()
 
+# المزامنة مع Firebase تتم في الخلفية من صندوق الإرسال المحلي
+sync_worker = SyncWorker.shared(db, firebase)
+
+# الأعمدة المعروضة في صفحات المعلمين وعدد المعلمين في كل صفحة أكواد
+TEACHER_TABLE_COLUMNS = ['name', 'teacher_code', 'supervisor_code', 'subjects', 'classes', 'is_supervisor_enabled']
+CODES_PAGE_SIZE = 50
+
 def main():
     st.title(f"{APP_ICON} {APP_TITLE}")
     
@@ -40,10 +49,14 @@ def main():
                 "إدارة المعلمين",
                 "إدارة الأكواد",
                 "عرض الجدول",
+                "الحصص الاحتياطية",
                 "الإحصائيات",
                 "حذف البيانات"
             ]
         )
+        
+        st.divider()
+        sync_status_panel()
     
     # عرض الصفحات
     if page == "رفع الجدول المدرسي":
@@ -54,11 +67,33 @@ def main():
         manage_codes_page()
     elif page == "عرض الجدول":
         view_schedule_page()
+    elif page == "الحصص الاحتياطية":
+        substitutes_page()
     elif page == "الإحصائيات":
         statistics_page()
     elif page == "حذف البيانات":
         delete_data_page()
 
+def sync_status_panel():
+    """حالة المزامنة مع Firebase في الشريط الجانبي"""
+    if firebase.backend.name == 'memory':
+        st.caption("📴 وضع عدم الاتصال: بيانات Firebase محفوظة في الذاكرة فقط")
+    elif firebase.backend.status == 'connecting':
+        st.caption("⏳ جاري الاتصال بـ Firebase...")
+    elif firebase.backend.status == 'failed':
+        st.caption(f"⚠️ تعذر الاتصال بـ Firebase: {firebase.backend.error}")
+    
+    status = db.get_sync_status()
+    if status['pending'] == 0:
+        st.caption("☁️ المزامنة مع Firebase مكتملة")
+        return
+    
+    st.caption(f"☁️ عمليات مزامنة معلقة: {status['pending']}")
+    if status['retrying']:
+        st.warning(f"إعادة محاولة {status['retrying']} عملية. آخر خطأ: {status['last_error']}")
+    if st.button("🔄 المزامنة الآن"):
+        sync_worker.notify()
+
 def upload_schedule_page():
     st.header("📁 رفع الجدول المدرسي")
     
@@ -74,8 +109,9 @@ def upload_schedule_page():
         
         if uploaded_file is not None:
             try:
-                # قراءة الملف
-                df = pd.read_excel(uploaded_file)
+                # قراءة الملف (كل الأوراق)
+                sheets = pd.read_excel(uploaded_file, sheet_name=None)
+                df = next(iter(sheets.values()))
                 
                 st.success("تم رفع الملف بنجاح!")
                 
@@ -83,37 +119,54 @@ def upload_schedule_page():
                 st.subheader("معاينة البيانات")
                 st.dataframe(df.head(10))
                 
+                refresh = st.checkbox(
+                    "إعادة المعالجة بالذكاء الاصطناعي",
+                    help="تجاهل النتيجة المحفوظة لهذا الملف وإرسال طلب جديد"
+                )
+                
                 # زر المعالجة
                 if st.button("🤖 معالجة البيانات بالذكاء الاصطناعي", type="primary"):
                     with st.spinner("جاري معالجة البيانات..."):
                         # معالجة البيانات بالذكاء الاصطناعي
-                        processed_data = ai.process_excel_to_json(df)
+                        processed_data = ai.process_excel_to_json(sheets, refresh=refresh)
                         
                         if processed_data:
                             st.success("تم معالجة البيانات بنجاح!")
+                            if ai.last_source == 'local':
+                                st.caption("تم التعرف على تنسيق الجدول وتحليله محلياً دون الذكاء الاصطناعي")
+                            elif ai.last_source == 'cache':
+                                stats = ai.cache.stats()
+                                st.caption(
+                                    f"نتيجة محفوظة لنفس المحتوى (إصابات {stats['hits']}، "
+                                    f"إخفاقات {stats['misses']}، محفوظة {stats['entries']})"
+                                )
+                            elif ai.last_source == 'fallback':
+                                failed = "، ".join(name or "الورقة" for name in ai.failed_chunks)
+                                st.warning(f"تعذر تحليل بعض البيانات بالذكاء الاصطناعي ({failed})، راجع البيانات المستخرجة")
                             
                             # حفظ في قاعدة البيانات المحلية
                             if db.save_schedule(processed_data):
                                 st.success("تم حفظ الجدول محلياً")
                             
-                            # مزامنة مع Firebase
-                            if firebase.sync_schedule(processed_data):
-                                st.success("تم رفع الجدول إلى Firebase")
-                            
                             # مزامنة المعلمين
                             if 'teachers' in processed_data:
                                 teachers = processed_data['teachers']
-                                for teacher in teachers:
-                                    db.add_teacher(
-                                        teacher['name'],
-                                        teacher.get('teacher_code', ''),
-                                        teacher.get('supervisor_code', ''),
-                                        teacher.get('subjects', []),
-                                        teacher.get('classes', [])
+                                counts = db.upsert_teachers(teachers)
+                                if counts:
+                                    st.success(
+                                        f"المعلمين: {counts['inserted']} جديد، "
+                                        f"{counts['updated']} محدث، {counts['unchanged']} بدون تغيير"
+                                    )
+                                else:
+                                    st.error(
+                                        "فشل في حفظ المعلمين ولم يُحفظ أي منهم، "
+                                        "تأكد من عدم تكرار رمز المشرف لمعلمين مختلفين"
                                     )
-                                
-                                if firebase.sync_teachers(teachers):
-                                    st.success("تم مزامنة بيانات المعلمين")
+                                db.link_schedule_teachers()
+                            
+                            # مزامنة مع Firebase في الخلفية
+                            sync_worker.notify()
+                            st.info("ستتم مزامنة الجدول والمعلمين مع Firebase في الخلفية")
                             
                             # عرض النتائج
                             st.subheader("نتائج المعالجة")
@@ -142,6 +195,7 @@ def upload_schedule_page():
         - يحتوي على أسماء المعلمين
         - يحتوي على المواد والفصول
         - منظم في جدول زمني
+        - الجداول بتنسيق (الأيام × الحصص لكل فصل) أو (الفصل، اليوم، الحصة، المادة، المعلم) تُحلل فوراً دون الذكاء الاصطناعي
         
         **سيقوم النظام بـ:**
         - استخراج أسماء المعلمين
@@ -154,15 +208,15 @@ def upload_schedule_page():
 def manage_teachers_page():
     st.header("👥 إدارة المعلمين")
     
-    # الحصول على المعلمين
-    teachers = db.get_all_teachers()
+    # عدد المعلمين
+    total = db.count_teachers()
     
-    if teachers:
-        st.subheader(f"المعلمين المسجلين ({len(teachers)})")
+    if total:
+        st.subheader(f"المعلمين المسجلين ({total})")
         
         # عرض المعلمين في جدول
         teachers_data = []
-        for teacher in teachers:
+        for teacher in db.iter_teachers(columns=TEACHER_TABLE_COLUMNS):
             teachers_data.append({
                 'الاسم': teacher['name'],
                 'كود المعلم': teacher['teacher_code'],
@@ -176,26 +230,36 @@ def manage_teachers_page():
         st.dataframe(df, use_container_width=True)
         
         # إحصائيات سريعة
+        counts = db.supervisor_counts()
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("إجمالي المعلمين", len(teachers))
+            st.metric("إجمالي المعلمين", counts['total'])
         with col2:
-            supervisors = sum(1 for t in teachers if t['supervisor_code'])
-            st.metric("المشرفين", supervisors)
+            st.metric("المشرفين", counts['supervisors'])
         with col3:
-            active_supervisors = sum(1 for t in teachers if t['is_supervisor_enabled'])
-            st.metric("المشرفين النشطين", active_supervisors)
+            st.metric("المشرفين النشطين", counts['active_supervisors'])
     else:
         st.info("لا توجد بيانات معلمين. قم برفع جدول مدرسي أولاً.")
 
 def manage_codes_page():
     st.header("🔐 إدارة الأكواد")
     
-    teachers = db.get_all_teachers()
+    total = db.count_teachers()
     
-    if teachers:
+    if total:
         st.subheader("إدارة أكواد المعلمين")
         
+        # التنقل بين الصفحات حسب آخر معرّف في الصفحة السابقة
+        cursors = st.session_state.setdefault('codes_page_cursors', [0])
+        teachers = list(db.iter_teachers(
+            columns=['id'] + TEACHER_TABLE_COLUMNS,
+            after_id=cursors[-1],
+            limit=CODES_PAGE_SIZE
+        ))
+        if not teachers and len(cursors) > 1:
+            st.session_state['codes_page_cursors'] = [0]
+            st.rerun()
+        
         for teacher in teachers:
             with st.expander(f"👤 {teacher['name']}"):
                 col1, col2, col3 = st.columns([2, 2, 1])
@@ -226,66 +290,114 @@ def manage_codes_page():
                     
                     if new_status != current_status:
                         if db.update_supervisor_status(teacher['id'], new_status):
-                            # مزامنة مع Firebase
-                            updated_teachers = db.get_all_teachers()
-                            firebase.sync_teachers(updated_teachers)
+                            # مزامنة مع Firebase في الخلفية
+                            sync_worker.notify()
                             st.success("تم تحديث الحالة")
                             st.rerun()
                 
                 # معلومات إضافية
                 st.write(f"**المواد:** {', '.join(teacher['subjects'])}")
                 st.write(f"**الفصول:** {', '.join(teacher['classes'])}")
+        
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if len(cursors) > 1 and st.button("⬅️ السابق"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"الصفحة {len(cursors)} من {(total + CODES_PAGE_SIZE - 1) // CODES_PAGE_SIZE}")
+        with col3:
+            if len(teachers) == CODES_PAGE_SIZE and st.button("التالي ➡️"):
+                cursors.append(teachers[-1]['id'])
+                st.rerun()
     else:
         st.info("لا توجد بيانات معلمين.")
 
 def view_schedule_page():
     st.header("📅 عرض الجدول المدرسي")
     
-    # الحصول على الجدول النشط
-    schedule = db.get_active_schedule()
+    # الحصول على فصول الجدول النشط
+    class_names = db.get_schedule_classes()
     
-    if schedule and 'schedule' in schedule:
-        schedule_data = schedule['schedule']
+    if class_names:
+        # اختيار الفصل
+        selected_class = st.selectbox("اختر الفصل", class_names)
         
-        if 'classes' in schedule_data:
-            classes = schedule_data['classes']
+        if selected_class:
+            st.subheader(f"جدول الفصل: {selected_class}")
+            
+            class_schedule = db.get_class_schedule(selected_class)
             
-            # اختيار الفصل
-            class_names = list(classes.keys())
-            selected_class = st.selectbox("اختر الفصل", class_names)
+            # عرض الجدول
+            days = list(class_schedule.keys())
             
-            if selected_class and selected_class in classes:
-                st.subheader(f"جدول الفصل: {selected_class}")
+            for day in days:
+                st.write(f"**{day}**")
                 
-                class_schedule = classes[selected_class]
+                periods = class_schedule[day]
                 
-                # عرض الجدول
-                days = list(class_schedule.keys())
+                # إنشاء جدول للحصص
+                periods_data = []
+                for period in periods:
+                    periods_data.append({
+                        'الحصة': period.get('period', ''),
+                        'المادة': period.get('subject', ''),
+                        'المعلم': period.get('teacher', '')
+                    })
                 
-                for day in days:
-                    st.write(f"**{day}**")
-                    
-                    periods = class_schedule[day]
-                    
-                    # إنشاء جدول للحصص
-                    periods_data = []
-                    for period in periods:
-                        periods_data.append({
-                            'الحصة': period.get('period', ''),
-                            'المادة': period.get('subject', ''),
-                            'المعلم': period.get('teacher', '')
-                        })
-                    
-                    if periods_data:
-                        df = pd.DataFrame(periods_data)
-                        st.dataframe(df, use_container_width=True)
-                    
-                    st.divider()
-        else:
-            st.warning("لا توجد بيانات فصول في الجدول")
+                if periods_data:
+                    df = pd.DataFrame(periods_data)
+                    st.dataframe(df, use_container_width=True)
+                
+                st.divider()
+    elif db.has_active_schedule():
+        st.warning("لا توجد بيانات فصول في الجدول")
     else:
         st.info("لا يوجد جدول مدرسي نشط. قم برفع جدول أولاً.")
 
+def substitutes_page():
+    st.header("🔄 الحصص الاحتياطية")
+    
+    teachers = db.get_teacher_names()
+    if not teachers:
+        st.info("لا توجد بيانات معلمين.")
+        return
+    
+    names = {teacher_id: name for teacher_id, name in teachers}
+    
+    selected_date = st.date_input("التاريخ", value=date.today())
+    absent_ids = st.multiselect(
+        "المعلمون الغائبون",
+        options=list(names.keys()),
+        default=[teacher_id for teacher_id in db.get_absent_teachers(selected_date) if teacher_id in names],
+        format_func=lambda teacher_id: names[teacher_id]
+    )
+    
+    if st.button("⚙️ توزيع الحصص الاحتياطية", type="primary"):
+        # تسجيل حضور اليوم ثم توزيع حصص الغائبين
+        db.record_attendance(selected_date, {teacher_id: teacher_id not in absent_ids for teacher_id in names})
+        substitutes = SubstituteEngine(db).assign(selected_date, absent_ids)
+        
+        if db.save_substitute_classes(selected_date, substitutes):
+            sync_worker.notify()
+            st.success(f"تم توزيع {len(substitutes)} حصة احتياطية")
+    
+    substitutes = db.get_substitute_classes(selected_date)
+    if substitutes:
+        st.subheader(f"حصص يوم {selected_date}")
+        df = pd.DataFrame([
+            {
+                'الفصل': item['class_name'],
+                'الحصة': item['period'],
+                'المعلم الغائب': names.get(item['original_teacher_id'], ''),
+                'المعلم البديل': names.get(item['substitute_teacher_id'], 'لا يوجد بديل')
+            }
+            for item in substitutes
+        ])
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.info("لا توجد حصص احتياطية لهذا اليوم.")
+
 def add_sample_data_page():
     st.header("📝 إضافة بيانات تجريبية")
     
@@ -331,12 +443,8 @@ def add_sample_data_page():
         if success_count > 0:
             st.success(f"تم إضافة {success_count} معلمين بنجاح!")
             
-            # مزامنة مع Firebase
-            all_teachers = db.get_all_teachers()
-            if firebase.sync_teachers(all_teachers):
-                st.success("تم رفع البيانات إلى Firebase")
-            else:
-                st.warning("فشل في رفع البيانات إلى Firebase")
+            # مزامنة مع Firebase في الخلفية
+            sync_worker.notify()
         else:
             st.error("فشل في إضافة المعلمين")
     
@@ -356,35 +464,26 @@ def add_sample_data_page():
 def statistics_page():
     st.header("📊 الإحصائيات")
     
-    teachers = db.get_all_teachers()
-    schedule = db.get_active_schedule()
+    counts = db.supervisor_counts()
+    subjects_count = db.count_teachers_per_subject()
     
-    if teachers:
+    if counts['total']:
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("إجمالي المعلمين", len(teachers))
+            st.metric("إجمالي المعلمين", counts['total'])
         
         with col2:
-            supervisors = sum(1 for t in teachers if t['supervisor_code'])
-            st.metric("المشرفين", supervisors)
+            st.metric("المشرفين", counts['supervisors'])
         
         with col3:
-            active_supervisors = sum(1 for t in teachers if t['is_supervisor_enabled'])
-            st.metric("المشرفين النشطين", active_supervisors)
+            st.metric("المشرفين النشطين", counts['active_supervisors'])
         
         with col4:
-            total_subjects = set()
-            for teacher in teachers:
-                total_subjects.update(teacher['subjects'])
-            st.metric("إجمالي المواد", len(total_subjects))
+            st.metric("إجمالي المواد", len(subjects_count))
         
         # رسم بياني للمواد
         st.subheader("توزيع المواد")
-        subjects_count = {}
-        for teacher in teachers:
-            for subject in teacher['subjects']:
-                subjects_count[subject] = subjects_count.get(subject, 0) + 1
         
         if subjects_count:
             fig = px.bar(
@@ -400,10 +499,7 @@ def statistics_page():
         
         # رسم بياني للفصول
         st.subheader("توزيع الفصول")
-        classes_count = {}
-        for teacher in teachers:
-            for class_name in teacher['classes']:
-                classes_count[class_name] = classes_count.get(class_name, 0) + 1
+        classes_count = db.count_teachers_per_class()
         
         if classes_count:
             fig = px.pie(
@@ -432,23 +528,20 @@ def delete_data_page():
     col1, col2, col3, col4 = st.columns(4)
     
     # عدد المعلمين
-    teachers = db.get_all_teachers()
     with col1:
-        st.metric("المعلمين (محلي)", len(teachers))
+        st.metric("المعلمين (محلي)", db.count_teachers())
     
     # عدد الجداول
-    active_schedule = db.get_active_schedule()
     with col2:
-        st.metric("الجداول النشطة (محلي)", 1 if active_schedule else 0)
+        st.metric("الجداول النشطة (محلي)", 1 if db.has_active_schedule() else 0)
     
-    # بيانات Firebase
-    firebase_teachers = firebase.get_teachers()
+    # بيانات Firebase (عدّ على الخادم بدون تنزيل المستندات، ولا انتظار قبل اكتمال الاتصال)
+    firebase_teachers = firebase.count_teachers() if firebase.is_ready else None
     with col3:
-        st.metric("المعلمين (Firebase)", len(firebase_teachers))
+        st.metric("المعلمين (Firebase)", firebase_teachers if firebase_teachers is not None else "—")
     
-    firebase_schedule = firebase.get_current_schedule()
     with col4:
-        st.metric("الجداول (Firebase)", 1 if firebase_schedule else 0)
+        st.metric("الجداول (Firebase)", (1 if firebase.has_current_schedule() else 0) if firebase.is_ready else "—")
     
     st.divider()
     
@@ -566,7 +659,10 @@ def delete_data_page():
             with st.spinner("جاري حذف بيانات Firebase..."):
                 try:
                     if hasattr(firebase, 'delete_all_data'):
-                        if firebase.delete_all_data():
+                        progress_text = st.empty()
+                        if firebase.delete_all_data(
+                            progress=lambda counts: progress_text.text(f"تم حذف {sum(counts.values())} مستند")
+                        ):
                             st.success("✅ تم حذف جميع بيانات Firebase بنجاح")
                             st.rerun()
                         else:
@@ -0,0 +1,537 @@
+import copy
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# قيمة بديلة لـ firestore.SERVER_TIMESTAMP تُستبدل بوقت الكتابة
+SERVER_TIMESTAMP = object()
+
+# حد Firestore لعدد العمليات في دفعة واحدة
+MAX_BATCH_SIZE = 500
+# عدد العمليات في كل طلب يرسله BulkWriter
+BULK_WRITER_BATCH_SIZE = 20
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class DocumentChange:
+    def __init__(self, change_type: ChangeType, document: 'DocumentSnapshot'):
+        self.type = change_type
+        self.document = document
+
+
+class DocumentSnapshot:
+    """لقطة مستند للقراءة فقط"""
+
+    def __init__(self, reference: 'DocumentReference', data: Optional[Dict], update_time: Optional[datetime] = None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field: str) -> Any:
+        return _get_field(self._data or {}, field)
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: int):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    """استعلام count() يُنفذ على الخادم ويُرجع العدد فقط"""
+
+    def __init__(self, query: 'Query', alias: str):
+        self._query = query
+        self._alias = alias
+
+    def get(self) -> List[List[AggregationResult]]:
+        client = self._query._client
+        client._round_trip()
+        with client._lock:
+            count = len(self._query._run())
+        # كما في Firestore: قراءة واحدة لكل 1000 مستند معدود (وقراءة واحدة على الأقل)
+        client._count('reads', max((count + 999) // 1000, 1))
+        return [[AggregationResult(self._alias, count)]]
+
+
+class Watch:
+    def __init__(self, client: 'MemoryFirestore', query, callback: Callable):
+        self._client = client
+        self.query = query
+        self.callback = callback
+        self.last: Dict[str, Dict] = {}
+        self.initialized = False
+
+    def unsubscribe(self):
+        self._client._remove_watch(self)
+
+
+class Query:
+    """استعلام على مجموعة: where / select / order_by / limit / start_after"""
+
+    def __init__(self, client: 'MemoryFirestore', path: str, filters: Tuple = (), fields: Optional[List[str]] = None,
+                 orders: Tuple = (), limit_count: Optional[int] = None, cursor: Optional[Tuple] = None):
+        self._client = client
+        self._path = path
+        self._filters = filters
+        self._fields = fields
+        self._orders = orders
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> 'Query':
+        values = {
+            'filters': self._filters, 'fields': self._fields, 'orders': self._orders,
+            'limit_count': self._limit, 'cursor': self._cursor
+        }
+        values.update(changes)
+        return Query(self._client, self._path, **values)
+
+    def where(self, field: str, op: str, value: Any) -> 'Query':
+        if op not in _OPERATORS:
+            raise ValueError(f"عامل مقارنة غير مدعوم: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def select(self, fields: List[str]) -> 'Query':
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field: str, direction: str = 'ASCENDING') -> 'Query':
+        return self._copy(orders=self._orders + ((field, direction == 'DESCENDING'),))
+
+    def limit(self, count: int) -> 'Query':
+        return self._copy(limit_count=count)
+
+    def start_after(self, document: DocumentSnapshot) -> 'Query':
+        return self._copy(cursor=self._sort_key((document.id, document._data or {})))
+
+    def _matches(self, doc_id: str, data: Dict) -> bool:
+        # كما في Firestore: الترتيب بحقل يستبعد المستندات التي لا تحتويه
+        if any(_get_field(data, field) is None for field, _ in self._orders):
+            return False
+        return all(_OPERATORS[op](_get_field(data, field), value) for field, op, value in self._filters)
+
+    def _sort_key(self, item) -> Tuple:
+        doc_id, data = item
+        return tuple(_Sortable(_get_field(data, field), descending) for field, descending in self._orders) + (doc_id,)
+
+    def _run(self) -> List[Tuple[str, Dict]]:
+        """تنفيذ الاستعلام على الحالة الحالية (يُستدعى والقفل محجوز)"""
+        documents = self._client._collections.get(self._path, {})
+        rows = sorted(
+            ((doc_id, data) for doc_id, data in documents.items() if self._matches(doc_id, data)),
+            key=self._sort_key
+        )
+        if self._cursor is not None:
+            rows = [row for row in rows if self._sort_key(row) > self._cursor]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._fields is not None:
+            rows = [(doc_id, {field: data[field] for field in self._fields if field in data}) for doc_id, data in rows]
+        return rows
+
+    def stream(self):
+        self._client._round_trip()
+        with self._client._lock:
+            rows = self._run()
+            times = self._client._update_times
+            snapshots = [
+                DocumentSnapshot(DocumentReference(self._client, self._path, doc_id), copy.deepcopy(data),
+                                 times.get((self._path, doc_id)))
+                for doc_id, data in rows
+            ]
+        # كما في Firestore: يُحتسب الاستعلام الفارغ قراءة واحدة
+        self._client._count('reads', max(len(snapshots), 1))
+        return iter(snapshots)
+
+    def get(self) -> List[DocumentSnapshot]:
+        return list(self.stream())
+
+    def count(self, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self, alias or 'count')
+
+    def on_snapshot(self, callback: Callable) -> Watch:
+        return self._client._add_watch(self, callback)
+
+
+class CollectionReference(Query):
+    def __init__(self, client: 'MemoryFirestore', path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> 'DocumentReference':
+        return DocumentReference(self._client, self._path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict, document_id: Optional[str] = None):
+        reference = self.document(document_id)
+        reference.set(data)
+        return self._client._now(), reference
+
+    def list_documents(self) -> List['DocumentReference']:
+        self._client._round_trip()
+        with self._client._lock:
+            ids = sorted(self._client._collections.get(self._path, {}))
+        return [DocumentReference(self._client, self._path, doc_id) for doc_id in ids]
+
+
+class DocumentReference:
+    def __init__(self, client: 'MemoryFirestore', collection_path: str, document_id: str):
+        if '/' in document_id:
+            raise ValueError(f"معرّف مستند غير صالح: {document_id}")
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+        self.path = f"{collection_path}/{document_id}"
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self) -> CollectionReference:
+        return CollectionReference(self._client, self._collection_path)
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths: Optional[List[str]] = None) -> DocumentSnapshot:
+        self._client._round_trip()
+        with self._client._lock:
+            data = self._client._collections.get(self._collection_path, {}).get(self.id)
+            if data is not None and field_paths is not None:
+                data = {field: data[field] for field in field_paths if field in data}
+            snapshot = DocumentSnapshot(self, copy.deepcopy(data),
+                                        self._client._update_times.get((self._collection_path, self.id)))
+        self._client._count('reads', 1)
+        return snapshot
+
+    def set(self, data: Dict, merge: bool = False):
+        self._client._commit([('set', self, data, merge)])
+
+    def update(self, data: Dict):
+        self._client._commit([('update', self, data, True)])
+
+    def delete(self):
+        self._client._commit([('delete', self, None, False)])
+
+    def on_snapshot(self, callback: Callable) -> Watch:
+        return self._client._add_watch(self, callback)
+
+    def _run(self) -> List[Tuple[str, Dict]]:
+        data = self._client._collections.get(self._collection_path, {}).get(self.id)
+        return [(self.id, data)] if data is not None else []
+
+
+class WriteBatch:
+    """دفعة كتابة ذرية تُنفذ في طلب واحد"""
+
+    def __init__(self, client: 'MemoryFirestore'):
+        self._client = client
+        self._operations = []
+
+    def set(self, reference: DocumentReference, data: Dict, merge: bool = False):
+        self._operations.append(('set', reference, data, merge))
+
+    def update(self, reference: DocumentReference, data: Dict):
+        self._operations.append(('update', reference, data, True))
+
+    def delete(self, reference: DocumentReference):
+        self._operations.append(('delete', reference, None, False))
+
+    def commit(self):
+        if len(self._operations) > MAX_BATCH_SIZE:
+            raise ValueError(f"الدفعة تتجاوز {MAX_BATCH_SIZE} عملية")
+        operations, self._operations = self._operations, []
+        self._client._commit(operations)
+
+
+class BulkWriter:
+    """كاتب جماعي غير ذري: يجمع العمليات ويرسلها في طلبات صغيرة متوازية عند flush"""
+
+    def __init__(self, client: 'MemoryFirestore'):
+        self._client = client
+        self._operations = []
+
+    def set(self, reference: DocumentReference, data: Dict, merge: bool = False):
+        self._operations.append(('set', reference, data, merge))
+
+    def delete(self, reference: DocumentReference):
+        self._operations.append(('delete', reference, None, False))
+
+    def flush(self):
+        operations, self._operations = self._operations, []
+        if not operations:
+            return
+        # الطلبات تُرسل معاً فيكلف flush زمن طلب واحد
+        self._client._delay()
+        for start in range(0, len(operations), BULK_WRITER_BATCH_SIZE):
+            self._client._commit(operations[start:start + BULK_WRITER_BATCH_SIZE], wait=False)
+
+    def close(self):
+        self.flush()
+
+
+class MemoryFirestore:
+    """بديل Firestore داخل العملية للعمل دون اتصال ولقياس استراتيجيات المزامنة
+
+    كل طلب (قراءة أو التزام دفعة) يتأخر بـ latency ثانية مع تذبذب اختياري،
+    وتُعد الطلبات والمستندات المقروءة والمكتوبة في stats. تُبلَّغ المستمعات
+    من خيط خلفي كما في العميل الحقيقي.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._collections: Dict[str, Dict[str, Dict]] = {}
+        self._update_times: Dict[Tuple[str, str], datetime] = {}
+        self._watches: List[Watch] = []
+        self._events = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self.stats = {'round_trips': 0, 'reads': 0, 'writes': 0, 'deletes': 0}
+
+    def collection(self, path: str) -> CollectionReference:
+        return CollectionReference(self, path)
+
+    def document(self, path: str) -> DocumentReference:
+        collection_path, document_id = path.rsplit('/', 1)
+        return DocumentReference(self, collection_path, document_id)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def bulk_writer(self, options=None) -> BulkWriter:
+        return BulkWriter(self)
+
+    def reset_stats(self):
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def clear(self):
+        """حذف كل البيانات (بدون إبلاغ المستمعات)"""
+        with self._lock:
+            self._collections.clear()
+            self._update_times.clear()
+
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _count(self, key: str, amount: int):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _round_trip(self, wait: bool = True):
+        self._count('round_trips', 1)
+        if wait:
+            self._delay()
+
+    def _delay(self):
+        delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _commit(self, operations: List[Tuple], wait: bool = True):
+        """تطبيق عمليات ('set'|'update'|'delete', ref, data, merge) ذرياً في طلب واحد
+
+        لا يُعدَّل أي مستند في مكانه: كل كتابة تضع نسخة جديدة، فيكفي المستمعات
+        الاحتفاظ بمراجع الحالة السابقة للمقارنة.
+        """
+        self._round_trip(wait)
+        with self._lock:
+            for kind, reference, _, _ in operations:
+                if kind == 'update' and reference.id not in self._collections.get(reference._collection_path, {}):
+                    raise KeyError(f"المستند غير موجود: {reference.path}")
+
+            now = self._now()
+            touched = set()
+            for kind, reference, data, merge in operations:
+                documents = self._collections.setdefault(reference._collection_path, {})
+                touched.add(reference._collection_path)
+                if kind == 'delete':
+                    documents.pop(reference.id, None)
+                    self._update_times.pop((reference._collection_path, reference.id), None)
+                    self.stats['deletes'] += 1
+                    continue
+                values = copy.deepcopy(_resolve(data, now))
+                if kind == 'update':
+                    document = copy.deepcopy(documents[reference.id])
+                    for field, value in values.items():
+                        _set_field(document, field, value)
+                    values = document
+                elif merge and reference.id in documents:
+                    document = copy.deepcopy(documents[reference.id])
+                    _merge(document, values)
+                    values = document
+                documents[reference.id] = values
+                self._update_times[(reference._collection_path, reference.id)] = now
+                self.stats['writes'] += 1
+            self._notify(touched)
+
+    def _add_watch(self, query, callback: Callable) -> Watch:
+        watch = Watch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            self._queue_event(watch)
+        return watch
+
+    def _remove_watch(self, watch: Watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, paths):
+        for watch in self._watches:
+            path = watch.query._path if isinstance(watch.query, Query) else watch.query._collection_path
+            if path in paths:
+                self._queue_event(watch)
+
+    def _queue_event(self, watch: Watch):
+        """حساب تغييرات مستمع وجدولة إبلاغه إن تغير شيء (والقفل محجوز)"""
+        rows = watch.query._run()
+        current = dict(rows)
+        if watch.initialized and watch.last == current:
+            return
+        changes = []
+        for doc_id, data in current.items():
+            if doc_id not in watch.last:
+                changes.append((ChangeType.ADDED, doc_id, data))
+            elif watch.last[doc_id] != data:
+                changes.append((ChangeType.MODIFIED, doc_id, data))
+        for doc_id in watch.last:
+            if doc_id not in current:
+                changes.append((ChangeType.REMOVED, doc_id, None))
+        watch.last = current
+        watch.initialized = True
+        self._events.put((watch, current, changes, self._now()))
+        self._start_dispatcher()
+
+    def _start_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name="memory-firestore-watch", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            # دمج الأحداث المتراكمة لكل مستمع في لقطة واحدة كما يفعل العميل الحقيقي
+            pending = {}
+            event = self._events.get()
+            while event is not None:
+                watch, current, changes, read_time = event
+                if watch in pending:
+                    changes = pending[watch][1] + changes
+                pending[watch] = (current, changes, read_time)
+                event = self._events.get_nowait() if not self._events.empty() else None
+            for watch, (current, changes, read_time) in pending.items():
+                self._deliver(watch, current, changes, read_time)
+
+    def _deliver(self, watch: Watch, current: Dict, changes: List, read_time: datetime):
+        if watch not in self._watches:
+            return
+        path = watch.query._path if isinstance(watch.query, Query) else watch.query._collection_path
+        snapshots = [
+            DocumentSnapshot(DocumentReference(self, path, doc_id), data, read_time)
+            for doc_id, data in current.items()
+        ]
+        if isinstance(watch.query, DocumentReference) and not snapshots:
+            snapshots = [DocumentSnapshot(watch.query, None, read_time)]
+        document_changes = [
+            DocumentChange(change_type, DocumentSnapshot(DocumentReference(self, path, doc_id), data, read_time))
+            for change_type, doc_id, data in changes
+        ]
+        try:
+            watch.callback(snapshots, document_changes, read_time)
+        except Exception as e:
+            print(f"خطأ في مستمع Firestore المحلي: {e}")
+
+
+class _Sortable:
+    """غلاف مقارنة يرتب القيم المختلطة والمفقودة (None أولاً) مع دعم الترتيب التنازلي"""
+
+    def __init__(self, value: Any, descending: bool = False):
+        self.key = (value is not None, type(value).__name__ if value is not None else '', value)
+        self.descending = descending
+
+    def __lt__(self, other):
+        return (self.key > other.key) if self.descending else (self.key < other.key)
+
+    def __gt__(self, other):
+        return other.__lt__(self)
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def _get_field(data: Dict, field: str) -> Any:
+    value = data
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _set_field(data: Dict, field: str, value: Any):
+    parts = field.split('.')
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _merge(target: Dict, values: Dict):
+    """دمج عميق كما في set(merge=True)"""
+    for key, value in values.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _resolve(value: Any, now: datetime) -> Any:
+    """استبدال SERVER_TIMESTAMP بوقت الكتابة"""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, dict):
+        return {key: _resolve(item, now) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, now) for item in value]
+    return value
+
+
+def _compare(op):
+    def check(left, right):
+        try:
+            return left is not None and op(left, right)
+        except TypeError:
+            return False
+    return check
+
+
+_OPERATORS = {
+    '==': lambda left, right: left == right,
+    '!=': lambda left, right: left is not None and left != right,
+    '<': _compare(lambda left, right: left < right),
+    '<=': _compare(lambda left, right: left <= right),
+    '>': _compare(lambda left, right: left > right),
+    '>=': _compare(lambda left, right: left >= right),
+    'in': lambda left, right: left in right,
+    'not-in': lambda left, right: left is not None and left not in right,
+    'array_contains': lambda left, right: isinstance(left, list) and right in left,
+    'array_contains_any': lambda left, right: isinstance(left, list) and any(item in left for item in right),
+}
@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, List
+from database import DatabaseManager
+from config import SYNC_PULL_PAGE_SIZE
+
+
+class PullSync:
+    """سحب التغييرات من Firestore إلى قاعدة البيانات المحلية حسب updated_at
+
+    لكل مجموعة موضع محفوظ (آخر updated_at ومعرّفات المستندات المطبقة عنده)، فلا
+    يُقرأ إلا ما تغير بعده، ويُستأنف السحب من نفس الموضع بعد أي انقطاع لأن
+    الموضع يُحفظ مع كل صفحة في نفس معاملة تطبيقها.
+
+    قواعد التعارض (لكل معلم ولكل علامة حضور):
+    - مستند يطابق بصمة آخر نسخة رفعناها هو صدى لكتابتنا ويُتجاهل.
+    - إذا تغيرت البيانات المحلية منذ آخر رفع فالنسخة المحلية تفوز، ويكتبها الرفع
+      التالي فوق البعيدة لأنها ما زالت تختلف عن سجل المزامنة.
+    - غير ذلك تفوز النسخة البعيدة لأنها أحدث من آخر سحب.
+
+    المستندات المحذوفة في Firebase لا تظهر في استعلام updated_at ولا تُحذف محلياً.
+    """
+
+    COLLECTIONS = ('teachers', 'attendance')
+
+    def __init__(self, db: DatabaseManager, firebase):
+        self.db = db
+        self.firebase = firebase
+
+    def pull_all(self) -> Dict[str, int]:
+        """سحب كل المجموعات وإرجاع عدد السجلات المطبقة لكل منها"""
+        return {collection: self.pull(collection) for collection in self.COLLECTIONS}
+
+    def pull(self, collection: str) -> int:
+        """سحب مستندات مجموعة تغيرت منذ آخر موضع محفوظ"""
+        client = self.firebase.db
+        if not client:
+            return 0
+
+        state = self.db.get_pull_cursor(collection) or {}
+        watermark = datetime.fromisoformat(state['updated_at']) if state.get('updated_at') else None
+        seen = set(state.get('ids', []))
+        # بعد صفحة ناقصة لا توجد مستندات أخرى بنفس updated_at (أوقات الخادم تتزايد)
+        complete = state.get('complete', False)
+        collection_ref = client.collection(collection)
+
+        applied = 0
+        while True:
+            docs = []
+            if watermark is not None:
+                if not complete:
+                    # مستندات لها نفس updated_at للموضع ولم تُطبق بعد (كتابات الدفعة الواحدة تتشارك الوقت)
+                    ties = collection_ref.where('updated_at', '==', watermark).stream()
+                    docs = [doc for doc in ties if doc.id not in seen]
+                query = collection_ref.where('updated_at', '>', watermark)
+            else:
+                query = collection_ref
+            page = list(query.order_by('updated_at').limit(SYNC_PULL_PAGE_SIZE).stream())
+            docs += page
+            if not docs:
+                return applied
+
+            last = docs[-1].get('updated_at')
+            ids = {doc.id for doc in docs if doc.get('updated_at') == last}
+            if last == watermark:
+                ids |= seen
+            complete = len(page) < SYNC_PULL_PAGE_SIZE
+            cursor = {'updated_at': last.isoformat(), 'ids': sorted(ids), 'complete': complete}
+
+            count = self._apply(collection, docs, cursor)
+            if count is None:
+                return applied
+            applied += count
+            watermark, seen = last, ids
+            if complete:
+                return applied
+
+    def _apply(self, collection: str, docs: List, cursor: Dict):
+        if collection == 'teachers':
+            return self._apply_teachers(docs, cursor)
+        if collection == 'attendance':
+            return self._apply_attendance(docs, cursor)
+        raise ValueError(f"مجموعة سحب غير معروفة: {collection}")
+
+    def _apply_teachers(self, docs: List, cursor: Dict):
+        manifest = self.db.get_sync_manifest('teachers')
+        teachers, hashes = {}, {}
+        for doc in docs:
+            document = self.firebase._teacher_document(doc.to_dict())
+            if not document.get('teacher_code'):
+                continue
+            digest = self.firebase._content_hash(document)
+            if manifest.get(doc.id) == digest:
+                continue
+            teachers[doc.id] = document
+            hashes[doc.id] = digest
+        return self.db.apply_remote_teachers(teachers, hashes, cursor, self._local_teacher_hash)
+
+    def _local_teacher_hash(self, teacher: Dict) -> str:
+        """بصمة صف المعلم المحلي كما سيُرفع، لمقارنتها بسجل المزامنة"""
+        return self.firebase._content_hash(self.firebase._teacher_document(teacher))
+
+    def _apply_attendance(self, docs: List, cursor: Dict):
+        ids_by_code = None
+        days = {}
+        for doc in docs:
+            data = doc.to_dict()
+            day = data.get('date') or doc.id
+            manifest = self.db.get_sync_manifest(f'attendance/{day}')
+            records = {}
+            for key, present in (data.get('records') or {}).items():
+                key = str(key).strip()
+                if key.isdigit():
+                    teacher_id = int(key)
+                else:
+                    # تطبيق الجوال قد يستخدم teacher_code بدلاً من المعرّف المحلي
+                    if ids_by_code is None:
+                        ids_by_code = {t['teacher_code']: t['id'] for t in self.db.get_all_teachers()}
+                    teacher_id = ids_by_code.get(key)
+                    if teacher_id is None:
+                        print(f"تجاهل علامة حضور بمعرّف معلم غير معروف ({day}): {key}")
+                        continue
+                if manifest.get(str(teacher_id)) != str(int(bool(present))):
+                    records[teacher_id] = bool(present)
+            days[day] = records
+        return self.db.apply_remote_attendance(days, cursor)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import zlib
+from typing import Dict, Optional, Tuple
+from config import SCHEDULE_COMPRESSION_LEVEL
+
+# أنواع ترميز نسخ الجدول المخزنة في schedule_blobs
+ENCODING_FULL = 'zlib'
+ENCODING_DELTA = 'zlib+delta'
+
+
+def canonical_bytes(schedule_data: Dict) -> bytes:
+    """تمثيل ثابت للجدول يُستخدم للبصمة والتخزين (مع الحفاظ على ترتيب الأيام والفصول)"""
+    return json.dumps(schedule_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def content_hash(data: bytes) -> str:
+    """بصمة SHA-256 لمحتوى الجدول"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress(data: bytes) -> bytes:
+    return zlib.compress(data, SCHEDULE_COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> bytes:
+    return zlib.decompress(data)
+
+
+def _classes(schedule_data: Dict) -> Dict:
+    return (schedule_data.get('schedule') or {}).get('classes') or {}
+
+
+def make_delta(base: Dict, schedule_data: Dict) -> Dict:
+    """فرق نسخة جديدة عن نسخة أساس: الفصول المتغيرة فقط، وباقي المفاتيح كاملة"""
+    base_classes = _classes(base)
+    classes = _classes(schedule_data)
+    top = {key: value for key, value in schedule_data.items() if key != 'schedule'}
+    schedule_rest = {key: value for key, value in (schedule_data.get('schedule') or {}).items() if key != 'classes'}
+    return {
+        'top': top,
+        'schedule': schedule_rest,
+        'order': list(classes.keys()),
+        'changed': {name: days for name, days in classes.items() if base_classes.get(name) != days}
+    }
+
+
+def apply_delta(base: Dict, delta: Dict) -> Dict:
+    """إعادة بناء النسخة الكاملة من نسخة الأساس والفرق"""
+    base_classes = _classes(base)
+    changed = delta['changed']
+    classes = {name: changed[name] if name in changed else base_classes[name] for name in delta['order']}
+    schedule_data = dict(delta['top'])
+    schedule_data['schedule'] = dict(delta['schedule'], classes=classes)
+    return schedule_data
+
+
+def encode_version(schedule_data: Dict, base: Optional[Tuple[str, Dict]] = None) -> Tuple[str, bytes, Optional[str]]:
+    """ترميز نسخة للتخزين: (encoding, payload, base_hash)
+
+    تُخزن النسخة كفرق عن الأساس فقط إذا كان الفرق المضغوط أصغر من نصف النسخة الكاملة.
+    """
+    full = compress(canonical_bytes(schedule_data))
+    if base is not None:
+        base_hash, base_data = base
+        delta = compress(canonical_bytes(make_delta(base_data, schedule_data)))
+        if len(delta) * 2 < len(full):
+            return ENCODING_DELTA, delta, base_hash
+    return ENCODING_FULL, full, None
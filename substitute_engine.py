@@ -0,0 +1,104 @@
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from database import DatabaseManager
+
+# أسماء الأيام كما تظهر في الجدول المدرسي (حسب date.weekday())
+ARABIC_WEEKDAYS = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]
+
+
+class SubstituteEngine:
+    """توزيع الحصص الاحتياطية على المعلمين المتفرغين
+
+    يُحسب لكل حصة (اليوم، الحصة) قناع بتات للمعلمين المشغولين، فيصبح
+    إيجاد المتفرغين عملية AND/NOT واحدة على أعداد صحيحة.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.teacher_ids: List[int] = []
+        self.teacher_index: Dict[str, int] = {}
+        self.busy: Dict[Tuple[str, str], int] = {}
+        self.all_mask = 0
+        self.load_schedule()
+
+    def load_schedule(self):
+        """بناء أقنعة الانشغال من الجدول النشط"""
+        teachers = self.db.get_teacher_names()
+        self.teacher_ids = [teacher_id for teacher_id, _ in teachers]
+        self.teacher_index = {name: index for index, (_, name) in enumerate(teachers)}
+        self.all_mask = (1 << len(self.teacher_ids)) - 1
+
+        self.busy = {}
+        for entry in self.db.get_schedule_entries():
+            index = self.teacher_index.get(entry['teacher'])
+            if index is None:
+                continue
+            slot = (entry['day'], entry['period'])
+            self.busy[slot] = self.busy.get(slot, 0) | (1 << index)
+
+    def _mask_for_ids(self, teacher_ids) -> int:
+        """تحويل قائمة معرّفات معلمين إلى قناع بتات"""
+        positions = {teacher_id: index for index, teacher_id in enumerate(self.teacher_ids)}
+        mask = 0
+        for teacher_id in teacher_ids:
+            if teacher_id in positions:
+                mask |= 1 << positions[teacher_id]
+        return mask
+
+    def free_teachers(self, day: str, period: str, exclude_mask: int = 0) -> int:
+        """قناع المعلمين المتفرغين في حصة محددة"""
+        return self.all_mask & ~self.busy.get((day, period), 0) & ~exclude_mask
+
+    def assign(self, substitute_date: date, absent_ids: Optional[List[int]] = None,
+               week_number: Optional[int] = None) -> List[Dict]:
+        """توزيع حصص المعلمين الغائبين في يوم محدد
+
+        يُختار لكل حصة المعلم المتفرغ الأقل عبئاً خلال الأسبوع، وتُرجع
+        الحصص التي لم يوجد لها بديل مع substitute_teacher_id = None.
+        """
+        if absent_ids is None:
+            absent_ids = self.db.get_absent_teachers(substitute_date)
+        if week_number is None:
+            week_number = self.db.week_start(substitute_date).isocalendar()[1]
+        day = ARABIC_WEEKDAYS[substitute_date.weekday()]
+
+        absent_mask = self._mask_for_ids(absent_ids)
+        if not absent_mask:
+            return []
+
+        weekly_load = self.db.get_substitute_load(substitute_date, exclude_date=substitute_date)
+        load = [weekly_load.get(teacher_id, 0) for teacher_id in self.teacher_ids]
+        taken: Dict[str, int] = {}
+
+        substitutes = []
+        for entry in self.db.get_schedule_entries(day):
+            index = self.teacher_index.get(entry['teacher'])
+            if index is None or not (absent_mask >> index) & 1:
+                continue
+
+            period = entry['period']
+            free = self.free_teachers(day, period, absent_mask | taken.get(period, 0))
+            best = None
+            while free:
+                low_bit = free & -free
+                candidate = low_bit.bit_length() - 1
+                if best is None or load[candidate] < load[best]:
+                    best = candidate
+                free ^= low_bit
+
+            substitute_id = None
+            if best is not None:
+                load[best] += 1
+                taken[period] = taken.get(period, 0) | (1 << best)
+                substitute_id = self.teacher_ids[best]
+
+            substitutes.append({
+                'original_teacher_id': self.teacher_ids[index],
+                'substitute_teacher_id': substitute_id,
+                'class_name': entry['class_name'],
+                'period': period,
+                'date': substitute_date.isoformat(),
+                'week_number': week_number
+            })
+
+        return substitutes
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+from typing import Optional
+from database import DatabaseManager
+from pull_sync import PullSync
+from config import SYNC_POLL_SECONDS, SYNC_RETRY_BASE_SECONDS, SYNC_RETRY_MAX_SECONDS, SYNC_PULL_SECONDS
+
+
+class SyncWorker:
+    """عامل خلفي يفرغ صندوق الإرسال إلى Firebase مع إعادة المحاولة والتأخير المتزايد،
+    ويسحب تغييرات Firebase إلى القاعدة المحلية كل SYNC_PULL_SECONDS"""
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db: DatabaseManager, firebase):
+        self.db = db
+        self.firebase = firebase
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.puller = PullSync(db, firebase)
+        self._last_pull = 0.0
+
+    @classmethod
+    def shared(cls, db: DatabaseManager, firebase) -> 'SyncWorker':
+        """العامل المشترك للعملية (يُنشأ ويبدأ مرة واحدة)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(db, firebase)
+                cls._shared.start()
+            return cls._shared
+
+    def start(self):
+        """تشغيل خيط العامل"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="firebase-sync", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """إيقاظ العامل فوراً بعد كتابة محلية"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(SYNC_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                self.drain()
+                if time.time() - self._last_pull >= SYNC_PULL_SECONDS:
+                    self._last_pull = time.time()
+                    self.puller.pull_all()
+            except Exception as e:
+                print(f"خطأ في عامل المزامنة: {e}")
+
+    def drain(self) -> int:
+        """تنفيذ كل العمليات المستحقة وإرجاع عدد الناجح منها"""
+        done = 0
+        for operation in self.db.get_due_sync_operations():
+            try:
+                success = self._execute(operation)
+                error = None if success else "فشلت المزامنة مع Firebase"
+            except Exception as e:
+                success, error = False, str(e)
+
+            if success:
+                self.db.complete_sync_operation(operation['id'], operation['version'])
+                done += 1
+            else:
+                delay = min(SYNC_RETRY_BASE_SECONDS * (2 ** operation['attempts']), SYNC_RETRY_MAX_SECONDS)
+                retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+                self.db.fail_sync_operation(operation['id'], operation['version'], error, retry_at)
+        return done
+
+    def _execute(self, operation) -> bool:
+        """رفع الحالة الحالية المرتبطة بالعملية"""
+        kind = operation['kind']
+        if kind == 'teachers':
+            return self.firebase.sync_teachers(self.db.get_all_teachers())
+        if kind == 'schedule':
+            schedule = self.db.get_active_schedule()
+            return schedule is None or self.firebase.sync_schedule(schedule)
+        if kind == 'substitutes':
+            week_start = date.fromisoformat(operation['payload'])
+            substitutes = self.db.get_substitute_classes(from_date=week_start, to_date=week_start + timedelta(days=6))
+            return self.firebase.update_substitute_classes(substitutes, week_start=week_start)
+        if kind == 'attendance':
+            day = operation['payload']
+            return self.firebase.update_attendance(day, self.db.get_attendance_by_date(day))
+        if kind == 'timetables':
+            # حصص الاحتياط من بداية الأسبوع الدراسي الحالي فما بعد
+            return self.firebase.sync_teacher_timetables(
+                list(self.db.iter_teachers(columns=['id', 'name', 'teacher_code'])),
+                self.db.get_schedule_entries(),
+                self.db.get_substitute_classes(from_date=self.db.week_start(date.today()))
+            )
+        print(f"نوع مزامنة غير معروف: {kind}")
+        return True
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from ai_cache import content_hash
+
+
+def test_content_hash_huge_numbers():
+    """الأرقام خارج نطاق int64 لا تُفشل البصمة وتُوحد مع كتابتها النصية"""
+    huge = pd.DataFrame({'المعلم': ['أحمد', 'خالد'], 'الرقم': [1e20, 2.0]})
+    text = pd.DataFrame({'المعلم': ['أحمد', 'خالد'], 'الرقم': ['100000000000000000000', '2']})
+
+    assert content_hash({'جدول': huge}, 'model', '1') == content_hash({'جدول': text}, 'model', '1')
+
+
+def test_content_hash_whole_numbers():
+    """1 و 1.0 لهما نفس البصمة، والكسور تبقى مختلفة"""
+    first = content_hash({'s': pd.DataFrame({'a': [1, 2]})}, 'model', '1')
+
+    assert first == content_hash({'s': pd.DataFrame({'a': [1.0, 2.0]})}, 'model', '1')
+    assert first != content_hash({'s': pd.DataFrame({'a': [1.5, 2.0]})}, 'model', '1')
@@ -0,0 +1,30 @@
+from database import DatabaseManager
+
+
+def test_new_database_uses_incremental_auto_vacuum(tmp_path):
+    """ملف قاعدة بيانات جديد يُنشأ بوضع auto_vacuum التدريجي مع WAL"""
+    db = DatabaseManager(str(tmp_path / 'school.db'))
+    conn = db.connections.get_connection()
+
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_cached_read_accepts_keyword_arguments(tmp_path):
+    """دوال القراءة المخزنة تقبل المعاملات بالاسم وتفصل نتائجها في الذاكرة"""
+    db = DatabaseManager(str(tmp_path / 'school.db'))
+
+    assert db.get_schedule_entries(day='الأحد') == db.get_schedule_entries('الأحد')
+    assert db.get_free_teachers(day='الأحد', period='1') == db.get_free_teachers(period='1', day='الأحد')
+
+
+def test_upsert_teachers_reports_duplicate_supervisor_code(tmp_path):
+    """تكرار رمز المشرف يُرجع False ولا يحفظ أي معلم"""
+    db = DatabaseManager(str(tmp_path / 'school.db'))
+    teachers = [
+        {'name': 'أحمد', 'teacher_code': 'T1', 'supervisor_code': 'S1'},
+        {'name': 'خالد', 'teacher_code': 'T2', 'supervisor_code': 'S1'},
+    ]
+
+    assert db.upsert_teachers(teachers) is False
+    assert db.count_teachers() == 0
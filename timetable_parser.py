@@ -0,0 +1,245 @@
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+DAYS = ["الأحد", "الاثنين", "الثلاثاء", "الأربعاء", "الخميس"]
+PERIODS = [f"الحصة {name}" for name in (
+    "الأولى", "الثانية", "الثالثة", "الرابعة", "الخامسة",
+    "السادسة", "السابعة", "الثامنة", "التاسعة", "العاشرة"
+)]
+
+ENGLISH_DAYS = ["sunday", "monday", "tuesday", "wednesday", "thursday"]
+
+# أسماء الأعمدة المقبولة لكل حقل في التنسيق الطولي (صف لكل حصة)
+COLUMN_ALIASES = {
+    'class': ("الفصل", "الصف", "الشعبة", "class"),
+    'day': ("اليوم", "day"),
+    'period': ("الحصة", "رقم الحصة", "period"),
+    'subject': ("المادة", "subject"),
+    'teacher': ("المعلم", "المعلمة", "اسم المعلم", "المدرس", "teacher"),
+}
+
+ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+CLASS_PATTERN = r'(\d+)\s*[/\\\-_]\s*(\d+)'
+# الفاصل بين المادة والمعلم داخل خلية الجدول: سطر جديد أو " - " أو " / " أو قوس
+CELL_SEPARATOR = r'\s*(?:\r?\n|\s[-–/|]\s|\()\s*'
+
+
+def normalize_text(values: pd.Series) -> pd.Series:
+    """توحيد كتابة النص العربي (الهمزات والتاء المربوطة والتطويل) للمقارنة"""
+    return (values.astype(str).str.translate(ARABIC_DIGITS)
+            .str.replace('ـ', '', regex=False)
+            .str.replace('[أإآ]', 'ا', regex=True)
+            .str.replace('ى', 'ي', regex=False)
+            .str.replace('ة', 'ه', regex=False)
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip().str.lower())
+
+
+def _key(text: str) -> str:
+    return normalize_text(pd.Series([text])).iat[0]
+
+
+DAY_KEYS = {re.sub('^ال', '', _key(day)): day for day in DAYS}
+DAY_KEYS.update(zip(ENGLISH_DAYS, DAYS))
+PERIOD_KEYS = {re.sub('^ال', '', _key(period.split(' ', 1)[1])): period for period in PERIODS}
+ALIAS_KEYS = {_key(alias): field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+
+def _days(values: pd.Series) -> pd.Series:
+    """اسم اليوم الموحد لكل قيمة أو NaN"""
+    keys = normalize_text(values).str.replace(r'^(?:يوم )?(?:ال)?', '', regex=True)
+    return keys.map(DAY_KEYS)
+
+
+def _periods(values: pd.Series) -> pd.Series:
+    """اسم الحصة الموحد لكل قيمة (رقم أو ترتيب بالحروف) أو NaN"""
+    keys = normalize_text(values).str.replace(r'^(?:ال)?حصه\s*', '', regex=True).str.replace('^ال', '', regex=True)
+    numbers = pd.to_numeric(keys.str.extract(r'^(\d+)(?:\.0+)?$', expand=False), errors='coerce')
+    by_number = numbers.map(lambda n: PERIODS[int(n) - 1] if 1 <= n <= len(PERIODS) else np.nan)
+    return keys.map(PERIOD_KEYS).fillna(by_number)
+
+
+def _lookup(cells: pd.DataFrame, func) -> pd.DataFrame:
+    """تطبيق _days أو _periods على كل خلايا الورقة دفعة واحدة (على القيم المختلفة فقط)"""
+    codes, uniques = pd.factorize(cells.to_numpy().ravel())
+    mapped = func(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)[codes]
+    return pd.DataFrame(mapped.reshape(cells.shape), index=cells.index, columns=cells.columns)
+
+
+def _class_name(text: str) -> Optional[str]:
+    match = re.search(CLASS_PATTERN, str(text).translate(ARABIC_DIGITS))
+    return f"{match.group(1)}/{match.group(2)}" if match else None
+
+
+class TimetableParser:
+    """تحليل جداول Excel المدرسية محلياً دون الذكاء الاصطناعي
+
+    التنسيقات المعروفة لكل ورقة:
+    - طولي: أعمدة الفصل واليوم والحصة والمادة والمعلم (صف لكل حصة).
+    - شبكة: صف عناوين بالحصص وعمود بالأيام لكل فصل (ويجوز عدة فصول في ورقة
+      واحدة، أو الأيام في الأعمدة والحصص في الصفوف). خلية الحصة "المادة" ثم
+      "المعلم" في سطر ثانٍ أو بعد " - "، وقد يمتد اليوم على عدة صفوف مدمجة.
+
+    parse تُرجع نفس هيكل JSON الذي يُنتجه الذكاء الاصطناعي، أو None إذا وُجدت ورقة
+    غير فارغة بتنسيق غير معروف؛ و split تُرجع ما أمكن تحليله مع الأوراق الباقية.
+    """
+
+    def parse(self, sheets: Dict[str, pd.DataFrame]) -> Optional[Dict]:
+        parsed, unrecognized = self.split(sheets)
+        return None if unrecognized else parsed
+
+    def split(self, sheets: Dict[str, pd.DataFrame]) -> Tuple[Optional[Dict], Dict[str, pd.DataFrame]]:
+        """تحليل الأوراق المعروفة معاً وإرجاع الأوراق غير الفارغة غير المعروفة كما هي"""
+        frames = []
+        unrecognized = {}
+        for sheet_name, data in sheets.items():
+            cells = self._cells(data)
+            if not cells.to_numpy().any():
+                continue
+            entries = self.parse_sheet(data, cells, sheet_name)
+            if entries is None:
+                unrecognized[sheet_name] = data
+            else:
+                frames.append(entries)
+
+        parsed = self._build(pd.concat(frames, ignore_index=True)) if frames else None
+        return parsed, unrecognized
+
+    def parse_sheet(self, data: pd.DataFrame, cells: pd.DataFrame, sheet_name: str = '') -> Optional[pd.DataFrame]:
+        """حصص ورقة واحدة (class, day, period, subject, teacher) أو None"""
+        entries = self._parse_long(data)
+        if entries is None:
+            entries = self._parse_grid(cells, sheet_name)
+        if entries is None:
+            entries = self._parse_grid(cells.T, sheet_name)
+        if entries is None or entries.empty:
+            return None
+        return entries
+
+    def _cells(self, data: pd.DataFrame) -> pd.DataFrame:
+        """قيم الورقة نصوصاً مع صف العناوين كأول صف (pandas يقرأ أول صف عناوين)"""
+        values = np.vstack([np.asarray(data.columns, dtype=object), data.to_numpy(dtype=object)])
+        flat = pd.Series(values.ravel()).fillna('').astype(str).str.strip()
+        flat = flat.mask(flat.str.match(r'^Unnamed: \d+'), '')
+        return pd.DataFrame(flat.to_numpy(dtype=object).reshape(values.shape))
+
+    def _parse_long(self, data: pd.DataFrame) -> Optional[pd.DataFrame]:
+        fields = pd.Series(normalize_text(pd.Series(data.columns, dtype=object)).map(ALIAS_KEYS).to_numpy(),
+                           index=data.columns)
+        fields = fields.dropna()
+        fields = fields[~fields.duplicated()]
+        if len(fields) < len(COLUMN_ALIASES):
+            return None
+
+        rows = data[list(fields.index)].set_axis(list(fields), axis=1)
+        rows = rows.where(rows.notna(), '').astype(str).apply(lambda column: column.str.strip())
+        classes = rows['class'].str.translate(ARABIC_DIGITS).str.extract(CLASS_PATTERN)
+        entries = pd.DataFrame({
+            'class': (classes[0] + '/' + classes[1]).fillna(rows['class']),
+            'day': _days(rows['day']),
+            'period': _periods(rows['period']),
+            'subject': rows['subject'],
+            'teacher': rows['teacher'],
+        })
+        entries = entries[(entries['class'] != '') & entries['day'].notna() & entries['period'].notna()]
+        return entries[(entries['subject'] != '') | (entries['teacher'] != '')]
+
+    def _parse_grid(self, cells: pd.DataFrame, sheet_name: str) -> Optional[pd.DataFrame]:
+        periods = _lookup(cells, _periods)
+        days = _lookup(cells, _days)
+        headers = np.flatnonzero(periods.notna().sum(axis=1).to_numpy() >= 2)
+        if not len(headers):
+            return None
+
+        bounds = list(headers) + [len(cells)]
+        blocks = []
+        previous_end = 0
+        for header, end in zip(bounds, bounds[1:]):
+            block = self._grid_block(cells, periods, days, header, end, previous_end, sheet_name, len(headers))
+            if block is None:
+                return None
+            entries, previous_end = block
+            blocks.append(entries)
+        return pd.concat(blocks, ignore_index=True)
+
+    def _grid_block(self, cells, periods, days, header, end, previous_end, sheet_name, block_count):
+        """فصل واحد: صف العناوين header وصفوف الأيام بعده حتى end
+
+        تُرجع الحصص مع نهاية صفوف الفصل؛ ما بعدها حتى end مقدمة الفصل التالي (عنوانه).
+        """
+        day_hits = days.iloc[header + 1:end].notna()
+        if day_hits.sum(axis=0).max() < 2:
+            return None
+        day_column = day_hits.sum(axis=0).idxmax()
+        period_columns = periods.columns[periods.iloc[header].notna() & (periods.columns != day_column)]
+
+        class_name = self._block_class(cells, header, day_column, previous_end, sheet_name, block_count)
+        if not class_name:
+            return None
+
+        # اليوم المدمج على عدة صفوف يظهر في أول صف فقط، وكل يوم يمتد نفس عدد الصفوف
+        day_rows = header + 1 + np.flatnonzero(day_hits[day_column].to_numpy())
+        span = int(np.median(np.diff(day_rows))) if len(day_rows) > 1 else 1
+        content_end = min(end, day_rows[-1] + span)
+        rows = slice(header + 1, content_end)
+        day_of_row = days.iloc[rows][day_column].ffill()
+        grid = cells.iloc[rows][period_columns][day_of_row.notna()]
+        grid = grid.groupby(day_of_row.dropna(), sort=False).agg(lambda column: '\n'.join(v for v in column if v))
+        grid.columns = periods.iloc[header][period_columns].to_numpy()
+
+        slots = grid.stack()
+        slots = slots[slots != '']
+        if slots.empty:
+            return None
+        parts = slots.str.split(CELL_SEPARATOR, n=1, regex=True, expand=True).reindex(columns=[0, 1]).fillna('')
+        entries = pd.DataFrame({
+            'class': class_name,
+            'day': slots.index.get_level_values(0),
+            'period': slots.index.get_level_values(1),
+            'subject': parts[0].str.strip().to_numpy(),
+            'teacher': parts[1].str.strip(' )').to_numpy(),
+        })
+        return entries, content_end
+
+    def _block_class(self, cells, header, day_column, previous_end, sheet_name, block_count) -> Optional[str]:
+        """اسم الفصل من زاوية الجدول أو الصفوف فوقه أو اسم الورقة"""
+        candidates = [cells.iat[header, day_column]]
+        candidates += [value for value in cells.iloc[previous_end:header].to_numpy().ravel() if value]
+        candidates.append(sheet_name)
+        for candidate in candidates:
+            name = _class_name(candidate)
+            if name:
+                return name
+        if block_count == 1 and sheet_name and not re.match(r'^(?:sheet|ورقة)\s*\d*$', sheet_name, re.I):
+            return sheet_name.strip()
+        return None
+
+    def _build(self, entries: pd.DataFrame) -> Optional[Dict]:
+        """بناء JSON المعلمين والجدول من جدول الحصص"""
+        entries = entries.drop_duplicates(subset=['class', 'day', 'period'], keep='first')
+        if entries.empty:
+            return None
+        entries = entries.assign(
+            class_order=pd.factorize(entries['class'])[0],
+            day_order=entries['day'].map({day: i for i, day in enumerate(DAYS)}),
+            period_order=entries['period'].map({period: i for i, period in enumerate(PERIODS)}),
+        ).sort_values(['class_order', 'day_order', 'period_order'], kind='mergesort')
+
+        classes: Dict[str, Dict[str, List[Dict]]] = {}
+        for (class_name, day), group in entries.groupby(['class', 'day'], sort=False):
+            classes.setdefault(class_name, {})[day] = group[['period', 'subject', 'teacher']].to_dict('records')
+
+        teachers = []
+        taught = entries[entries['teacher'] != '']
+        for i, (name, group) in enumerate(taught.groupby('teacher', sort=False)):
+            teachers.append({
+                "name": name,
+                "subjects": [subject for subject in group['subject'].unique() if subject],
+                "classes": list(group['class'].unique()),
+                "teacher_code": f"T{str(i+1).zfill(3)}",
+                "supervisor_code": f"S{str(i+1).zfill(3)}"
+            })
+
+        return {"teachers": teachers, "schedule": {"classes": classes}}